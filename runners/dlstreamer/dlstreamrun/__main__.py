@@ -16,6 +16,7 @@ from tasks.object_classification import ObjectClassification
 from tasks.object_tracking import ObjectTracking
 from tasks.object_detection_multi import ObjectDetectionMulti
 from tasks.task import Task
+from tasks.task import labels_supported
 import sys
 import signal
 
@@ -43,6 +44,27 @@ def print_args(args):
         print ("\t{} == {}".format(arg, getattr(args, arg)))
     print()
 
+def wait_for_piperun_config(control_path):
+    # Resolve cached runner details before blocking so that they are
+    # not part of the ramp up once a piperun config arrives
+    try:
+        labels_supported()
+    except Exception as error:
+        print("Can't query gvadetect: {}".format(error))
+
+    with open(control_path) as control_file:
+        message = json.loads(control_file.readline())
+
+    for stream, key in [(sys.stdout, "stdout"), (sys.stderr, "stderr")]:
+        if message.get(key):
+            stream.flush()
+            output_fd = os.open(message[key], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            os.dup2(output_fd, stream.fileno())
+            os.close(output_fd)
+
+    os.environ.update(message.get("environment", {}))
+    return message["piperun-config"]
+
 def cleanup(_signal_unused=None,_frame_unused_=None):
     children = psutil.Process().children(recursive=True)
     for child in children:
@@ -62,13 +84,21 @@ if __name__ == '__main__':
         atexit.register(cleanup)
 
         args, parser = parse_args(program_name=package_name)
+
+        systeminfo = None
+        if args.systeminfo:
+            systeminfo = load_document(args.systeminfo)
+
+        if args.worker:
+            args.piperun_config = wait_for_piperun_config(args.worker)
+
         print_args(args)
 
         args.piperun_config_path = args.piperun_config
         args.piperun_config = load_document(args.piperun_config)
 
         if args.systeminfo:
-            args.systeminfo = load_document(args.systeminfo)
+            args.systeminfo = systeminfo
 
         task = Task.create_task(args.piperun_config,args)
 
@@ -6,6 +6,7 @@
 '''
 
 import os
+import sys
 import yaml
 import json
 from tasks.task import Task
@@ -34,11 +35,28 @@ def print_args(args):
         print ("\t{} == {}".format(arg, getattr(args, arg)))
     print()
 
+def wait_for_piperun_config(control_path):
+    with open(control_path) as control_file:
+        message = json.loads(control_file.readline())
+
+    for stream, key in [(sys.stdout, "stdout"), (sys.stderr, "stderr")]:
+        if message.get(key):
+            stream.flush()
+            output_fd = os.open(message[key], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            os.dup2(output_fd, stream.fileno())
+            os.close(output_fd)
+
+    os.environ.update(message.get("environment", {}))
+    return message["piperun-config"]
 
     
 if __name__ == '__main__':
 
     args, parser = parse_args(program_name=package_name)
+
+    if args.worker:
+        args.piperun_config = wait_for_piperun_config(args.worker)
+
     print_args(args)
     
 
@@ -19,14 +19,21 @@ def parse_args(args=None,program_name=package_name):
     
     parser.add_argument("--systeminfo", action="store", dest="systeminfo",required=False)
     
-    parser.add_argument("piperun_config", metavar="piperun config", action="store", help="piperun configuration file (.piperun.yml)")
+    parser.add_argument("--worker", action="store", dest="worker", required=False,
+                        help="Control FIFO to wait on for a piperun config. Used by the pipebench runner pool.")
+
+    parser.add_argument("piperun_config", metavar="piperun config", action="store", nargs="?", help="piperun configuration file (.piperun.yml)")
 
     
     if (isinstance(args, dict)):
         args = ["--{}={}".format(key, value)
                 for key, value in args.items() if value]
 
+    parsed_args = parser.parse_args(args)
+
+    if (not parsed_args.piperun_config and not parsed_args.worker):
+        parser.error("piperun config is required")
 
-    return parser.parse_args(args), parser
+    return parsed_args, parser
 
     
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+'''
+* Copyright (C) 2019 Intel Corporation.
+*
+* SPDX-License-Identifier: MIT
+'''
+
+# Measures the maximum number of metadata lines per second a single
+# pipebench memory sink can account for. The writer replays a
+# prebuilt block of json lines so that it always outruns the sink.
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import time
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pipebench.tasks.media_util import MediaSink
+from pipebench.tasks.media_engine import MediaEngine
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--objects", type=int, default=20,
+                        help="Number of detected objects per line")
+    parser.add_argument("--duration", type=float, default=5,
+                        help="Seconds to run each sink")
+    parser.add_argument("--sample-size", type=int, default=30,
+                        help="Sample size used by the sink")
+    parser.add_argument("--io-engine", action="append", dest="io_engines",
+                        choices=["threads", "event-loop"], default=None,
+                        help="Sink implementation to measure, can be given multiple times (default: all)")
+    return parser.parse_args()
+
+
+def _create_lines(objects):
+    line = {"objects": [{"detection": {"bounding_box": {"x_max": 0.5,
+                                                         "x_min": 0.25,
+                                                         "y_max": 0.5,
+                                                         "y_min": 0.25},
+                                        "confidence": 0.75,
+                                        "label": "person",
+                                        "label_id": 1},
+                         "h": 100, "roi_type": "person",
+                         "w": 50, "x": 10, "y": 20}
+                        for _ in range(objects)],
+            "resolution": {"height": 1080, "width": 1920},
+            "timestamp": 0}
+    line = (json.dumps(line) + "\n").encode()
+    return line * max(1, (1024 * 1024) // len(line)), len(line)
+
+
+def _write(path, block, duration, result):
+    written = 0
+    with open(path, "wb", buffering=0) as fifo:
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            fifo.write(block)
+            written += len(block)
+    result["bytes"] = written
+
+
+def _measure(io_engine, directory, block, line_size, args):
+    fifo_path = os.path.join(directory, "fifo.{}".format(io_engine))
+    os.mkfifo(fifo_path)
+    engine = None
+    if io_engine == "event-loop":
+        engine = MediaEngine(daemon=True)
+        engine.start()
+    sink = MediaSink(fifo_path,
+                     "pipe://{}".format(fifo_path),
+                     "metadata/objects,format=jsonl",
+                     warm_up=0,
+                     sample_size=args.sample_size,
+                     output_dir=directory,
+                     engine=engine,
+                     daemon=True)
+    sink.start()
+    result = {}
+    start = time.time()
+    _write(fifo_path, block, args.duration, result)
+    while not sink._end_time:
+        time.sleep(0.1)
+    elapsed = sink._end_time - start
+    sink.stop()
+    if engine:
+        engine.stop()
+        engine.join()
+    os.unlink(fifo_path)
+    return {"IO Engine": io_engine,
+            "Line Bytes": line_size,
+            "Lines/s": sink._frame_count / elapsed,
+            "MB/s": result["bytes"] / elapsed / (1024*1024)}
+
+
+if __name__ == '__main__':
+    args = _parse_args()
+    io_engines = args.io_engines if args.io_engines else ["threads", "event-loop"]
+    block, line_size = _create_lines(args.objects)
+    with tempfile.TemporaryDirectory() as directory:
+        results = [_measure(io_engine, directory, block, line_size, args) for io_engine in io_engines]
+    print(tabulate(results, headers="keys", floatfmt=".2f"))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+'''
+* Copyright (C) 2019 Intel Corporation.
+*
+* SPDX-License-Identifier: MIT
+'''
+
+# Measures how fast the pipebench memory source can feed a FIFO
+# using each feed method. The reader drains the FIFO as fast as
+# possible so the reported rate is the ceiling of the source itself.
+
+import os
+import sys
+import argparse
+import tempfile
+import threading
+import time
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pipebench.tasks.media_util import MediaSource
+from pipebench.tasks.media_util import FEED_MODES
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--frames", type=int, default=300,
+                        help="Number of frames in synthetic input")
+    parser.add_argument("--frame-size", type=int, default=64*1024,
+                        help="Size of each synthetic frame in bytes")
+    parser.add_argument("--duration", type=float, default=5,
+                        help="Seconds to run each feed method")
+    parser.add_argument("--batch-size", type=int, default=32,
+                        help="Frames per write for writev and splice")
+    parser.add_argument("--pipe-size", type=int, default=0,
+                        help="Requested pipe size in bytes (0 = OS default)")
+    parser.add_argument("--target-fps", type=int, default=30,
+                        help="Target fps of a single pipeline stream")
+    parser.add_argument("--feed-mode", action="append", dest="feed_modes",
+                        choices=FEED_MODES, default=None,
+                        help="Feed method to measure, can be given multiple times (default: all)")
+    return parser.parse_args()
+
+
+def _create_input(input_directory, frames, frame_size):
+    for index in range(frames):
+        path = os.path.join(input_directory, "frame_{:06d}.x-h264.bin".format(index))
+        with open(path, "wb") as frame_file:
+            frame_file.write(os.urandom(frame_size))
+
+
+def _drain(path, result):
+    bytes_read = 0
+    with open(path, "rb", buffering=0) as fifo:
+        buffer = bytearray(1024*1024)
+        while True:
+            count = fifo.readinto(buffer)
+            if not count:
+                break
+            bytes_read += count
+    result["bytes"] = bytes_read
+    result["end"] = time.perf_counter()
+
+
+def _measure(feed_mode, input_directory, args):
+    fifo_path = os.path.join(input_directory, "fifo.{}".format(feed_mode))
+    os.mkfifo(fifo_path)
+    result = {}
+    reader = threading.Thread(target=_drain, args=(fifo_path, result), daemon=True)
+    reader.start()
+    source = MediaSource(fifo_path,
+                         "pipe://{}".format(fifo_path),
+                         "video/x-h264",
+                         input_directory,
+                         frame_rate=-1,
+                         feed_mode=feed_mode,
+                         batch_size=args.batch_size,
+                         pipe_size=args.pipe_size,
+                         daemon=True)
+    start = time.perf_counter()
+    source.start()
+    time.sleep(args.duration)
+    source.stop()
+    source.join()
+    reader.join()
+    os.unlink(fifo_path)
+    elapsed = result["end"] - start
+    frames = result["bytes"] / args.frame_size
+    return {"Feed": feed_mode,
+            "FPS": frames / elapsed,
+            "MB/s": result["bytes"] / elapsed / (1024*1024),
+            "Streams at target": int(frames / elapsed / args.target_fps)}
+
+
+if __name__ == '__main__':
+    args = _parse_args()
+    feed_modes = args.feed_modes if args.feed_modes else FEED_MODES
+    with tempfile.TemporaryDirectory() as input_directory:
+        _create_input(input_directory, args.frames, args.frame_size)
+        results = [_measure(feed_mode, input_directory, args) for feed_mode in feed_modes]
+    print(tabulate(results, headers="keys", floatfmt=".2f"))
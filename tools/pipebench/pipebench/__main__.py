@@ -24,6 +24,7 @@ import subprocess
 import atexit
 import signal
 import psutil
+import sys
 
 def print_args(args):
     if args.verbose_level > 0:
@@ -62,6 +63,7 @@ def cleanup():
 
 if __name__ == '__main__':
     parser = None
+    exit_code = None
     try:
         os.setpgrp()
         atexit.register(cleanup)
@@ -71,7 +73,7 @@ if __name__ == '__main__':
 
         initialize(parser, args)
         args.pipelines = list_pipelines()
-        args.command(args)
+        exit_code = args.command(args)
     except(KeyboardInterrupt, SystemExit):
         pass
     
@@ -83,4 +85,7 @@ if __name__ == '__main__':
             parser.error("\n\n\n{}\n\n\n".format(error))
         else:
             print("\n\n\n{}\n\n\n".format(error))
-        
+
+    if exit_code:
+        sys.exit(exit_code)
+
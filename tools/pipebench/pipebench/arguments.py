@@ -9,6 +9,8 @@ import json
 import distutils.util
 import shtab
 import pipebench.commands
+import pipebench.cache
+import pipebench.metrics
 
 def find_zoo_root():
     path = os.path.realpath(__file__)
@@ -168,9 +170,11 @@ def _add_measurement_settings(parser):
                                       " Must be less than or equal to--starting-streams (default: 1)")
 
     measurement_settings.add_argument("--search-method",
-                                      choices=["linear","binary"],
+                                      choices=["linear","binary","model"],
                                       help="Method for finding maximum stream density."
-                                      "Note: binary is experimental at this time. (default: linear)")
+                                      "Note: binary is experimental at this time."
+                                      " model fits total fps to a saturating curve and tests the predicted density."
+                                      " (default: linear)")
 
     measurement_settings.add_argument("--generate-reference",
                                       action="store_true",
@@ -184,6 +188,83 @@ def _add_measurement_settings(parser):
                                       "Note: Pipeline output is not needed for performance measurements"
                                       " and can impact FPS (default: False)")
 
+    measurement_settings.add_argument("--source-feed",
+                                      choices=["frame", "writev", "splice"],
+                                      help="Method used by the memory source to feed frames."
+                                      " frame writes one frame per call. writev and splice"
+                                      " write runs of SOURCE_BATCH_SIZE frames per call when"
+                                      " TARGET_FPS is not enforced. (default: frame)")
+
+    measurement_settings.add_argument("--source-batch-size",
+                                      type=int,
+                                      help="Number of frames coalesced into a single write"
+                                      " by the writev and splice feed methods. (default: 32)")
+
+    measurement_settings.add_argument("--pipe-size",
+                                      type=int,
+                                      help="Size in bytes requested for memory source pipes."
+                                      " If set to 0 the OS default is used. (default: 0)")
+
+    measurement_settings.add_argument("--io-engine",
+                                      choices=["threads", "event-loop"],
+                                      help="How pipebench reads and writes stream FIFOs."
+                                      " threads uses one source and one sink thread per stream."
+                                      " event-loop multiplexes all FIFOs on a single thread. (default: threads)")
+
+    measurement_settings.add_argument("--pacing-policy",
+                                      choices=["catch-up", "drop"],
+                                      help="How the memory source keeps TARGET_FPS when a write is late."
+                                      " catch-up sends late frames back to back until the schedule is met."
+                                      " drop skips the missed send slots and continues from the current time."
+                                      " Frames are always sent in order. (default: catch-up)")
+
+    measurement_settings.add_argument("--runner-pool",
+                                      action="store_true",
+                                      help="Pre-start runner processes that wait for a piperun config"
+                                      " so that all runners of an iteration start together."
+                                      " Requires a runner that supports --worker. (default: False)")
+
+    measurement_settings.add_argument("--reuse-runners",
+                                      action="store_true",
+                                      help="Keep runner processes running between iterations and only start or stop"
+                                      " the difference in streams. Requires a memory source and streams-per-process."
+                                      " (default: False)")
+
+    measurement_settings.add_argument("--early-stop-confidence",
+                                      type=float,
+                                      help="End an iteration as soon as its result is known with this confidence"
+                                      " (e.g. 0.95) based on per stream sample fps. 0 disables early stopping."
+                                      " Not used with target-condition total. (default: 0)")
+
+    measurement_settings.add_argument("--early-stop-min-samples",
+                                      type=int,
+                                      help="Minimum number of samples per stream before an iteration can end early."
+                                      " (default: 10)")
+
+    measurement_settings.add_argument("--frame-latency",
+                                      action="store_true",
+                                      help="Measure end to end latency of each frame from the memory source"
+                                      " to the memory sink. Assumes one output per input frame. (default: False)")
+
+    measurement_settings.add_argument("--fps-series",
+                                      action="store_true",
+                                      help="Record the time and frame count of every fps sample of each stream"
+                                      " and save them per iteration as fps-series.npy. (default: False)")
+
+    measurement_settings.add_argument("--resource-monitor",
+                                      action="store_true",
+                                      help="Sample cpu, memory, threads and context switches of each runner process tree"
+                                      " and per core utilization every second. Summaries are reported per iteration"
+                                      " and samples saved as resources.npz. (default: False)")
+
+    measurement_settings.add_argument("--workload-synthesis",
+                                      choices=["multi-pass", "single-pass"],
+                                      help="How workload inputs are generated."
+                                      " multi-pass concatenates, converts the frame rate and splits the media"
+                                      " into frames in separate passes."
+                                      " single-pass writes the elementary stream and its frame index"
+                                      " in one ffmpeg pass. (default: multi-pass)")
+
 
 def _get_parser(program_name="pipebench"):
     parser = argparse.ArgumentParser(prog=program_name,fromfile_prefix_chars='@',
@@ -192,7 +273,7 @@ def _get_parser(program_name="pipebench"):
     common_parser = _get_common_parser()
 
     subparsers = parser.add_subparsers(dest="command",
-                                       metavar="list, download, run",
+                                       metavar="list, download, prepare, run, compare",
                                        title="commands")
     subparsers.required = True
 
@@ -201,6 +282,140 @@ def _get_parser(program_name="pipebench"):
                                         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     list_parser.set_defaults(command=pipebench.commands.list_pipelines)
 
+    compare_parser = subparsers.add_parser("compare",
+                                           parents=[common_parser],
+                                           formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    compare_parser.set_defaults(command=pipebench.commands.compare)
+
+    compare_parser.add_argument("--measurement-directory",
+                                required=False,
+                                dest="measurement_directory",
+                                help="Directory to index results from instead of the workspace",
+                                default=None)
+
+    compare_parser.add_argument("--baseline",
+                                required=False,
+                                dest="baseline",
+                                help="Baseline run directory, result.json or pattern matching"
+                                " <pipeline>/<measurement>/<runner-settings>/<run>."
+                                " If not set the latest run of each runner settings is compared to the run before it.",
+                                default=None)
+
+    compare_parser.add_argument("--candidate",
+                                required=False,
+                                dest="candidate",
+                                help="Candidate run directory, result.json or pattern matching"
+                                " <pipeline>/<measurement>/<runner-settings>/<run>",
+                                default=None)
+
+    compare_parser.add_argument("--noise-threshold",
+                                required=False,
+                                dest="noise_threshold",
+                                type=float,
+                                help="Relative change below which differences are treated as noise",
+                                default=0.05)
+
+    compare_parser.add_argument("--significance",
+                                required=False,
+                                dest="significance",
+                                type=float,
+                                help="Maximum permutation test p-value of a significant change in per stream metrics",
+                                default=0.05)
+
+    compare_parser.add_argument("--permutations",
+                                required=False,
+                                dest="permutations",
+                                type=int,
+                                help="Number of permutations in the permutation test",
+                                default=10000)
+
+    compare_parser.add_argument("--output",
+                                required=False,
+                                dest="output",
+                                help="Save the comparison as json",
+                                default=None)
+
+    compare_parser.add_argument("--reindex",
+                                required=False,
+                                dest="reindex",
+                                action="store_true",
+                                help="Rescan the measurement directories and update the results index",
+                                default=False)
+
+    prepare_parser = subparsers.add_parser("prepare",
+                                           parents=[common_parser],
+                                           formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    prepare_parser.set_defaults(command=pipebench.commands.prepare)
+
+    prepare_parser.add_argument("prepare_pipelines",
+                                metavar="pipeline",
+                                nargs="*",
+                                help="Pipelines to prepare",
+                                default=[])
+
+    prepare_parser.add_argument("--all",
+                                required=False,
+                                dest="all",
+                                action="store_true",
+                                help="Prepare all pipelines of the zoo",
+                                default=False)
+
+    prepare_parser.add_argument("--workers",
+                                required=False,
+                                dest="workers",
+                                type=int,
+                                help="Maximum number of preparation steps to run in parallel",
+                                default=os.cpu_count())
+
+    prepare_parser.add_argument("--measure",
+                                required=False,
+                                dest="measurement",
+                                default="throughput",
+                                choices=["throughput", "density", "latency"],
+                                help="Measurement to prepare workloads for. Used as selector "\
+                                "for measurement settings.")
+
+    prepare_parser.add_argument("--platform",
+                                required=False,
+                                help="Platform name. Used as selector "\
+                                "for measurement settings.")
+
+    prepare_parser.add_argument("--measurement-settings",
+                                action="store",
+                                required=False,
+                                help="Measurement settings to load",
+                                default=None).complete=shtab.FILE
+
+    prepare_parser.add_argument("--force",
+                                required=False,
+                                dest="force",
+                                action="store_true",
+                                help="Force regeneration of existing workloads",
+                                default=False)
+
+    prepare_parser.add_argument("--workload-cache",
+                                required=False,
+                                dest="workload_cache",
+                                help="Directory of the workload cache shared between pipelines and workspaces."
+                                " Defaults to $PIPEBENCH_CACHE or ~/.cache/pipebench",
+                                default=pipebench.cache.default_cache_root())
+
+    prepare_parser.add_argument("--no-workload-cache",
+                                required=False,
+                                dest="no_workload_cache",
+                                action="store_true",
+                                help="Generate workloads without the workload cache",
+                                default=False)
+
+    prepare_parser.add_argument("--no-reference-cache",
+                                required=False,
+                                dest="no_reference_cache",
+                                action="store_true",
+                                help="Generate references without the reference cache",
+                                default=False)
+
+    _add_measurement_settings(prepare_parser)
+
     common_parser.add_argument("pipeline",
                                metavar="pipeline",
                                choices=list_pipelines()[0])
@@ -287,6 +502,57 @@ def _get_parser(program_name="pipebench"):
                             action="store_true",
                             help="Force clearing of previous results",
                             default=False)
+
+    run_parser.add_argument("--resume",
+                            required=False,
+                            dest="resume",
+                            action="store_true",
+                            help="Resume the latest run from its checkpoint using the measurement settings"
+                            " of that run. Completed iterations are not repeated.",
+                            default=False)
+
+    run_parser.add_argument("--workload-cache",
+                            required=False,
+                            dest="workload_cache",
+                            help="Directory of the workload cache shared between pipelines and workspaces."
+                            " Defaults to $PIPEBENCH_CACHE or ~/.cache/pipebench",
+                            default=pipebench.cache.default_cache_root())
+
+    run_parser.add_argument("--no-workload-cache",
+                            required=False,
+                            dest="no_workload_cache",
+                            action="store_true",
+                            help="Generate workloads without the workload cache",
+                            default=False)
+
+    run_parser.add_argument("--no-reference-cache",
+                            required=False,
+                            dest="no_reference_cache",
+                            action="store_true",
+                            help="Generate references without the reference cache",
+                            default=False)
+
+    run_parser.add_argument("--metrics-port",
+                            required=False,
+                            dest="metrics_port",
+                            type=int,
+                            help="Serve live measurement metrics in the Prometheus text format"
+                            " on http://<host>:<port>/metrics",
+                            default=None)
+
+    run_parser.add_argument("--metrics-address",
+                            required=False,
+                            dest="metrics_address",
+                            help="Address the metrics http server binds to."
+                            " Use 0.0.0.0 to allow scraping from other hosts",
+                            default=pipebench.metrics.DEFAULT_ADDRESS)
+
+    run_parser.add_argument("--metrics-socket",
+                            required=False,
+                            dest="metrics_socket",
+                            help="Write live measurement metrics in the Prometheus text format"
+                            " to each client connecting to this unix socket",
+                            default=None)
     
     #run_parser.add_argument("--override",
     #                        action="append",
@@ -0,0 +1,117 @@
+'''
+* Copyright (C) 2019 Intel Corporation.
+*
+* SPDX-License-Identifier: MIT
+'''
+
+import os
+import json
+import errno
+import fcntl
+import shutil
+import hashlib
+import tempfile
+import subprocess
+
+CACHE_ENVIRONMENT = "PIPEBENCH_CACHE"
+DEFAULT_CACHE_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "pipebench")
+METADATA_FILE = "cache-entry.json"
+FILE_HASHES = "file-hashes"
+
+
+def default_cache_root():
+    return os.environ.get(CACHE_ENVIRONMENT, DEFAULT_CACHE_ROOT)
+
+
+def link_tree(source, target):
+    # Hard links, a reflink copy across file systems
+    os.makedirs(target, exist_ok=True)
+    try:
+        for root, directories, files in os.walk(source):
+            relative_root = os.path.relpath(root, source)
+            for directory in directories:
+                os.makedirs(os.path.join(target, relative_root, directory), exist_ok=True)
+            for file_name in files:
+                target_path = os.path.join(target, relative_root, file_name)
+                if os.path.lexists(target_path):
+                    os.remove(target_path)
+                os.link(os.path.join(root, file_name), target_path)
+    except OSError as error:
+        if error.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        subprocess.run(["cp", "-R", "--reflink=auto", "{}/.".format(source), target], check=True)
+
+
+def hash_file(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as input_file:
+        for block in iter(lambda: input_file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_key(**fields):
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode()).hexdigest()
+
+
+# Entries are written to a temporary directory and renamed into place
+class ContentCache(object):
+
+    def __init__(self, root, namespace):
+        self.root = os.path.join(os.path.abspath(root), namespace)
+        self._hashes_root = os.path.join(self.root, FILE_HASHES)
+        os.makedirs(self._hashes_root, exist_ok=True)
+
+    def _entry(self, key):
+        return os.path.join(self.root, key)
+
+    def file_hash(self, path):
+        # One hash entry per file, reused while inode, size and mtime are unchanged
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        signature = [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+        entry_path = os.path.join(self._hashes_root,
+                                  "{}.json".format(hashlib.sha256(path.encode()).hexdigest()))
+        try:
+            with open(entry_path) as entry_file:
+                entry = json.load(entry_file)
+            if entry["path"] == path and entry["signature"] == signature:
+                return entry["hash"]
+        except (OSError, ValueError, KeyError):
+            pass
+        digest = hash_file(path)
+        with open(os.path.join(self._hashes_root, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            with tempfile.NamedTemporaryFile("w", dir=self._hashes_root, delete=False) as entry_file:
+                json.dump({"path": path, "signature": signature, "hash": digest}, entry_file)
+            os.replace(entry_file.name, entry_path)
+        return digest
+
+    def fetch(self, key, target):
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, METADATA_FILE)) as metadata_file:
+                metadata = json.load(metadata_file)
+        except (OSError, ValueError):
+            return None
+        link_tree(os.path.join(entry, "data"), target)
+        return metadata
+
+    def store(self, key, source, metadata=None):
+        entry = self._entry(key)
+        if os.path.isdir(entry):
+            return
+        temp_entry = tempfile.mkdtemp(dir=self.root, prefix=".{}-".format(key[:8]))
+        try:
+            link_tree(source, os.path.join(temp_entry, "data"))
+            with open(os.path.join(temp_entry, METADATA_FILE), "w") as metadata_file:
+                json.dump(metadata if metadata else {}, metadata_file, indent=4)
+            os.rename(temp_entry, entry)
+        except OSError as error:
+            shutil.rmtree(temp_entry, ignore_errors=True)
+            # Another writer stored the same key first
+            if not os.path.isdir(entry):
+                raise error
+
+    def invalidate(self, key):
+        shutil.rmtree(self._entry(key), ignore_errors=True)
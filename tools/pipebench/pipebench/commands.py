@@ -5,6 +5,7 @@
 '''
 
 import os
+import copy
 import glob
 import shlex
 import subprocess
@@ -21,17 +22,43 @@ import time
 import math
 import sys
 from pipebench.tasks.media_util import FpsReport
+from pipebench.tasks.media_util import MediaSink
 from pipebench.util import print_action
 import json
 from pipebench.tasks.task import Task
+from pipebench.tasks.media_engine import MediaEngine
+from pipebench.tasks.runner_util import RunnerPool
 from tabulate import tabulate
 import tempfile
 import time
 from statistics import mean
+from statistics import NormalDist
 import subprocess
 from threading import Semaphore
-import re
-import copy
+from threading import Thread
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from concurrent.futures import FIRST_COMPLETED
+from pipebench.latency import read_latency_file
+from pipebench.latency import StreamLatency
+from pipebench.latency import LatencyHistogram
+from pipebench.tasks.stream_counters import StreamCounters
+from pipebench.tasks.stream_counters import DEFAULT_CAPACITY
+from pipebench.tasks.stream_counters import LAYOUT_FILE
+import numpy
+from pipebench.metrics import MetricsExporter
+from pipebench.resources import ResourceMonitor
+from pipebench.resources import EnergyMeter
+import pipebench.compare
+from pipebench.results_index import ResultsIndex
+from pipebench.results_index import RESULTS_INDEX_FILE
+from pipebench.cache import ContentCache
+import sqlite3
+
+CHECKPOINT_FILE = "checkpoint.json"
 
 
 def _get_runner_settings(measurement, args, add_default_platform=False, no_overrides=False):
@@ -179,21 +206,35 @@ def _load_measurement_settings(args):
 
     args.parser.error("Measurement settings not found in workspace.\n\tCandidates: {}".format(candidates))
 
-def _get_run_number(target_directory):
+def _open_results_index(args):
+    try:
+        return ResultsIndex(os.path.join(args.workspace_root, RESULTS_INDEX_FILE))
+    except sqlite3.Error as error:
+        print_action("Warning: Results index not available: {}".format(error))
+        return None
+
+def _get_run_number(target_directory, results_index=None):
     previous_runs = []
-    if not os.path.isdir(target_directory):
-        return 0
-    for path in os.listdir(target_directory):
-        if os.path.isdir(os.path.join(target_directory,path)):
-            if path.startswith("run-"):
-                try:
-                    path = path.replace("run-","")
-                    previous_runs.append(int(path))
-                except:
-                    pass
-
-    max_previous = max(previous_runs)
-    return max_previous+1
+    if os.path.isdir(target_directory):
+        for path in os.listdir(target_directory):
+            if os.path.isdir(os.path.join(target_directory,path)):
+                if path.startswith("run-"):
+                    try:
+                        path = path.replace("run-","")
+                        previous_runs.append(int(path))
+                    except:
+                        pass
+
+    run_number = 0
+    if previous_runs:
+        run_number = max(previous_runs)+1
+
+    # The index can be stale, never reuse an existing run directory
+    if results_index:
+        index_run_number = results_index.next_run_number(target_directory)
+        if index_run_number is not None:
+            run_number = max(run_number, index_run_number)
+    return run_number
 
 def _prepare_run_directory(args):
     pipeline_path = find_pipeline(args.pipeline, args)
@@ -204,7 +245,38 @@ def _prepare_run_directory(args):
 
     args.pipeline_root = os.path.dirname(pipeline_path)
 
-    measurement_settings, measurement_settings_path = _load_measurement_settings(args)
+    runner_settings, runner_settings_path = _get_runner_settings(
+        args.measurement,
+        args)
+
+    runner_settings_name = (os.path.basename(runner_settings_path).
+                            replace(".runner-settings.yml","").
+                            replace(".{}".format(args.measurement),
+                                    ""))
+
+    target_root = args.pipeline_root
+
+    if (args.measurement_directory):
+        target_root = os.path.abspath(
+            os.path.join(args.measurement_directory,
+                         os.path.basename(args.pipeline_root)))
+
+
+    target_dir = os.path.join(target_root,
+                              "measurements",
+                              args.measurement,
+                              runner_settings_name)
+
+    checkpoint = None
+    if (args.resume):
+        if (args.force):
+            args.parser.error("--resume can not be combined with --force")
+        run_directory, checkpoint = _find_checkpoint(target_dir, args)
+        measurement_settings = checkpoint["measurement_settings"]
+        measurement_settings_path = os.path.join(run_directory,
+                                                 args.measurement+".measurement-settings.yml")
+    else:
+        measurement_settings, measurement_settings_path = _load_measurement_settings(args)
 
 
     task = Task.create_task(measurement_settings, pipeline_path, args)
@@ -218,10 +290,10 @@ def _prepare_run_directory(args):
 
     _prepare(task, measurement_settings, args)
 
-
-    runner_settings, runner_settings_path = _get_runner_settings(
-        args.measurement,
-        args)
+    if (checkpoint):
+        args.measurement_settings_path = measurement_settings_path
+        args.runner_settings_path = runner_settings_path
+        return run_directory, measurement_settings, checkpoint["runner_settings"], task, checkpoint
 
     if "latency" in measurement_settings:
         runner_settings["latency"] = measurement_settings["latency"]
@@ -235,34 +307,22 @@ def _prepare_run_directory(args):
     if measurement_settings["streams-per-process"] != 1:
         runner_settings["streams-per-process"] = measurement_settings["streams-per-process"]
 
-    runner_settings_name = (os.path.basename(runner_settings_path).
-                            replace(".runner-settings.yml","").
-                            replace(".{}".format(args.measurement),
-                                    ""))
-
-    target_root = args.pipeline_root
-
-    if (args.measurement_directory):
-        target_root = os.path.abspath(
-            os.path.join(args.measurement_directory,
-                         os.path.basename(args.pipeline_root)))
-
-
-    target_dir = os.path.join(target_root,
-                              "measurements",
-                              args.measurement,
-                              runner_settings_name)
-
+    results_index = _open_results_index(args)
     if (args.force):
         try:
             shutil.rmtree(target_dir)
         except Exception as error:
             pass
+        if results_index:
+            results_index.remove_runs(target_dir)
 
     run_directory = os.path.join(target_dir,
-                                 "run-{:04d}".format(_get_run_number(target_dir)))
+                                 "run-{:04d}".format(_get_run_number(target_dir, results_index)))
 
     create_directory(run_directory)
+    if results_index:
+        results_index.add_run(run_directory, args.runner, args.platform)
+        results_index.close()
 
     _write_measurement_settings(measurement_settings,
                                 args.measurement,
@@ -294,9 +354,37 @@ def _prepare_run_directory(args):
                 run_directory)
     args.measurement_settings_path = measurement_settings_path
     args.runner_settings_path = runner_settings_path
-    return run_directory, measurement_settings, runner_settings, task
-
-def _estimate_starting_streams(args, run_directory, task, measurement_settings):
+    return run_directory, measurement_settings, runner_settings, task, None
+
+def _find_checkpoint(target_dir, args):
+    run_directory = None
+    if os.path.isdir(target_dir):
+        runs = sorted([path for path in os.listdir(target_dir)
+                       if path.startswith("run-") and os.path.isdir(os.path.join(target_dir,path))])
+        if runs:
+            run_directory = os.path.join(target_dir, runs[-1])
+    if not run_directory:
+        args.parser.error("No previous run to resume in {}".format(target_dir))
+
+    checkpoint_path = os.path.join(run_directory, CHECKPOINT_FILE)
+    if not os.path.isfile(checkpoint_path):
+        args.parser.error("No checkpoint found in {}".format(run_directory))
+    with open(checkpoint_path) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    if checkpoint["complete"]:
+        args.parser.error("Run {} is already complete".format(run_directory))
+    print_action("Resuming: {}".format(run_directory),
+                 ["Iteration: {}".format(checkpoint["search"]["iteration"]),
+                  "Streams: {}".format(checkpoint["search"]["num_streams"])])
+    return run_directory, checkpoint
+
+def _write_checkpoint(run_directory, checkpoint):
+    checkpoint_path = os.path.join(run_directory, CHECKPOINT_FILE)
+    with open(checkpoint_path + ".temp", "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file, indent=4)
+    os.replace(checkpoint_path + ".temp", checkpoint_path)
+
+def _estimate_starting_streams(args, run_directory, task, measurement_settings, counters, engine=None):
     runner_settings, _ = _get_runner_settings("throughput",
                                               args,
                                               True,
@@ -308,11 +396,28 @@ def _estimate_starting_streams(args, run_directory, task, measurement_settings):
                                     runner_settings,
                                     measurement_settings["warm-up"],
                                     -1,
-                                    measurement_settings["sample-size"])
-    per_stream_results, totals, number_of_runners = _wait_for_task([(sources,sinks,runner,temp_run_directory)],
-                                                measurement_settings["duration"]," PRE")
+                                    measurement_settings["sample-size"],
+                                    engine = engine,
+                                    counters = counters)
+    per_stream_results, totals, number_of_runners, _ = _wait_for_task([(sources,sinks,runner,temp_run_directory)],
+                                                measurement_settings["duration"],
+                                                counters,
+                                                " PRE")
     return math.floor(totals["avg"]/measurement_settings["target-fps"])
 
+RUNNER_DIRECTORY_LINK = "runner"
+
+def _reusable_runners(active_runners, stream_indices, streams_per_process, num_streams):
+    reusable = []
+    for process_index, (sources, sinks, runner_process, _) in enumerate(active_runners):
+        if ((process_index >= len(stream_indices)) or
+            (runner_process.poll() is not None) or
+            (sinks[0]._stream_index != stream_indices[process_index]) or
+            (len(sinks) != min(streams_per_process, num_streams - stream_indices[process_index]))):
+            break
+        reusable.append(active_runners[process_index])
+    return reusable
+
 def _run_iteration(num_streams,
                    streams_per_process,
                    numa_nodes,
@@ -322,15 +427,48 @@ def _run_iteration(num_streams,
                    target_dir,
                    task,
                    iteration,
-                   max_processes):
+                   max_processes,
+                   counters,
+                   engine=None,
+                   runner_pool=None,
+                   active_runners=None,
+                   metrics=None):
     semaphore = Semaphore(0)
-    process_index = 0
     runners = []
+    start_time = time.time()
     if not streams_per_process:
         streams_per_process = num_streams
         if max_processes:
             streams_per_process = math.ceil(num_streams / max_processes)
-    for stream_index in range(0, num_streams, streams_per_process):
+    stream_indices = range(0, num_streams, streams_per_process)
+    process_numa_nodes = [index % numa_nodes if numa_nodes else None
+                          for index in range(len(stream_indices))]
+
+    if (active_runners is not None):
+        runners = _reusable_runners(active_runners, stream_indices, streams_per_process, num_streams)
+        _stop_task(active_runners[len(runners):])
+        for (sources, sinks, _, runner_directory) in runners:
+            # Runner logs stay in the directory of the iteration that started
+            # the runner, sink output moves to the current iteration
+            run_directory = os.path.join(target_dir,
+                                         "iteration-{:04d}".format(iteration),
+                                         os.path.basename(runner_directory))
+            create_directory(run_directory)
+            os.symlink(os.path.relpath(runner_directory, run_directory),
+                       os.path.join(run_directory, RUNNER_DIRECTORY_LINK))
+            for source, sink in zip(sources, sinks):
+                if (source):
+                    source.reset()
+                sink.reset(run_directory)
+        if (runners):
+            print_action("Reusing {} runner processes, starting {}".format(
+                len(runners), len(stream_indices) - len(runners)))
+
+    process_index = len(runners)
+    new_streams = num_streams - sum([len(sinks) for (_, sinks, _, _) in runners])
+    if (runner_pool):
+        runner_pool.reserve(process_numa_nodes[process_index:])
+    for stream_index in stream_indices[process_index:]:
         end_stream_index = stream_index + streams_per_process -1
         if end_stream_index >= num_streams:
             end_stream_index = num_streams - 1
@@ -349,9 +487,7 @@ def _run_iteration(num_streams,
                                      run_directory_suffix)
         create_directory(run_directory)
 
-        numa_node = None
-        if (numa_nodes):
-            numa_node = process_index % numa_nodes
+        numa_node = process_numa_nodes[process_index]
 
         gpu_render_device = None
         if (gpu_render_devices):
@@ -366,15 +502,129 @@ def _run_iteration(num_streams,
                                            numa_node = numa_node,
                                            gpu_render_device = gpu_render_device,
                                            starting_stream_index = stream_index,
-                                           number_of_streams=(end_stream_index-stream_index+1))
+                                           number_of_streams=(end_stream_index-stream_index+1),
+                                           engine = engine,
+                                           runner_pool = runner_pool,
+                                           counters = counters)
 
         runners.append((sources,sinks,runner,run_directory))
         process_index += 1
 
-    for stream_index in range(num_streams):
+    for stream_index in range(new_streams):
         semaphore.release()
+    launch_time = time.time() - start_time
+    if (metrics):
+        metrics.start_iteration(iteration, num_streams, runners)
+    resource_monitor = None
+    if (measurement_settings["resource-monitor"]):
+        resource_monitor = ResourceMonitor([(process_index, runner_process.pid)
+                                            for process_index, (_, _, runner_process, _)
+                                            in enumerate(runners)])
+        resource_monitor.start()
+    energy_meter = EnergyMeter()
+    stream_indices = [sink._stream_index for (_, sinks, _, _) in runners for sink in sinks]
+    start_frames = counters.column("frames")[stream_indices].sum()
+    start_energy = energy_meter.read()
+
+    results, totals, early_stop = _measure_task(runners,
+                                                measurement_settings["duration"] + 10,
+                                                counters,
+                                                "{:04d}".format(iteration),
+                                                measurement_settings)
+    end_energy = energy_meter.read()
+    frames = counters.column("frames")[stream_indices].sum() - start_frames
+    if (resource_monitor):
+        resource_monitor.stop()
+    if (active_runners is not None):
+        active_runners[:] = runners
+        _check_return_codes([(runner_process.returncode, run_directory)
+                             for (_, _, runner_process, run_directory) in runners
+                             if runner_process.poll() is not None])
+    else:
+        _stop_task(runners)
+
+        if (runner_pool):
+            runner_pool.reserve(process_numa_nodes)
+
+    iteration_details = {"ramp_up":_ramp_up_details(runners, start_time, launch_time)}
+    frame_latency = _frame_latency_details(runners)
+    if (frame_latency):
+        iteration_details["frame_latency"] = frame_latency
+    if (early_stop):
+        iteration_details["early_stop"] = early_stop
+    if (measurement_settings["fps-series"]):
+        iteration_details["fps_series"] = _write_fps_series(runners,
+                                                            target_dir,
+                                                            "iteration-{:04d}".format(iteration))
+    if (resource_monitor):
+        iteration_details["resources"] = _resource_details(resource_monitor,
+                                                           runners,
+                                                           target_dir,
+                                                           "iteration-{:04d}".format(iteration))
+    iteration_details["efficiency"] = _efficiency_details(num_streams,
+                                                          sum([stream_result.avg for stream_result in results]),
+                                                          _get_physical_cores(target_dir),
+                                                          iteration_details.get("resources"),
+                                                          energy_meter.energy(start_energy, end_energy),
+                                                          int(frames),
+                                                          start_energy,
+                                                          end_energy)
+
+    return results, totals, len(runners), _stream_details(runners), iteration_details
+
+def _ramp_up_details(runners, start_time, launch_time):
+    measure_start_times = [sink._start_time
+                           for (sources, sinks, runner_process, _) in runners
+                           for sink in sinks if sink._start_time]
+    ramp_up_time = None
+    if measure_start_times:
+        ramp_up_time = max(measure_start_times) - start_time
+    return {"launch_time":launch_time,
+            "ramp_up_time":ramp_up_time}
+
+RESOURCES_FILE = "resources.npz"
+
+def _get_physical_cores(run_directory):
+    try:
+        with open(os.path.join(run_directory, "systeminfo.json")) as systeminfo_file:
+            cpu = json.load(systeminfo_file)["cpu"]
+        return cpu["NumberOfCPUs"] * cpu["NumberOfSockets"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
 
-    return _wait_for_task(runners, measurement_settings["duration"] + 10,"{:04d}".format(iteration))
+def _efficiency_details(num_streams, total_fps, physical_cores, resources,
+                        energy, frames, start_energy, end_energy):
+    efficiency = {}
+    if physical_cores:
+        efficiency["physical_cores"] = physical_cores
+        efficiency["streams_per_core"] = round(num_streams / physical_cores, 4)
+        efficiency["fps_per_core"] = round(total_fps / physical_cores, 4)
+    if resources and resources.get("rss"):
+        rss_gb = resources["rss"]["avg"] / 2**30
+        if rss_gb:
+            efficiency["fps_per_gb_rss"] = round(total_fps / rss_gb, 4)
+    if energy and frames:
+        duration = end_energy[0] - start_energy[0]
+        efficiency["energy"] = round(energy, 4)
+        efficiency["power"] = round(energy / duration, 4) if duration else None
+        efficiency["energy_per_frame"] = round(energy / frames, 6)
+        efficiency["fps_per_watt"] = round(frames / energy, 4)
+    return efficiency
+
+def _resource_details(resource_monitor, runners, target_dir, iteration_directory):
+    path = os.path.join(iteration_directory, RESOURCES_FILE)
+    resource_monitor.save(os.path.join(target_dir, path))
+    # Summarize the measured window, after the last stream finished warm up
+    measure_start_times = [sink._start_time
+                           for (_, sinks, _, _) in runners
+                           for sink in sinks if sink._start_time]
+    summary = resource_monitor.summary(max(measure_start_times) if measure_start_times else None)
+    if summary is None:
+        summary = resource_monitor.summary()
+    if summary is None:
+        return {"time_series":path}
+    summary["time_series"] = path
+    return summary
 
 def _summarize_measurement(args,
                            run_directory,
@@ -389,17 +639,80 @@ def _summarize_measurement(args,
     print(" \t{}\n".format(os.path.basename(args.measurement_settings_path)))
     print(" Output Directory:\n\t{}\n".format(run_directory))
 
+def _create_engine(measurement_settings, args):
+    if measurement_settings["io-engine"] != "event-loop":
+        return None
+    engine = MediaEngine(verbose_level=args.verbose_level, daemon=True)
+    engine.start()
+    return engine
+
+def _create_runner_pool(measurement_settings, runner_settings, task, args):
+    if not measurement_settings["runner-pool"]:
+        return None
+    return RunnerPool(args.runner,
+                      runner_settings,
+                      task._pipeline.pipeline_root,
+                      os.path.join(args.workload_root,"systeminfo.json"),
+                      redirect=(args.verbose_level < 2),
+                      verbose_level=args.verbose_level)
+
+def _create_metrics_exporter(counters, args):
+    if args.metrics_port is None and not args.metrics_socket:
+        return None
+    metrics = MetricsExporter(counters, args.metrics_port, args.metrics_socket, args.metrics_address)
+    details = []
+    if args.metrics_port is not None:
+        details.append("http://{}:{}/metrics".format(args.metrics_address, args.metrics_port))
+    if args.metrics_socket:
+        details.append("unix:{}".format(os.path.abspath(args.metrics_socket)))
+    print_action("Serving Metrics", details)
+    return metrics
+
 def run(args):
-    run_directory, measurement_settings, runner_settings, task = _prepare_run_directory(args)
+    run_directory, measurement_settings, runner_settings, task, checkpoint = _prepare_run_directory(args)
 
     _summarize_measurement(args,
                            run_directory,
                            measurement_settings,
                            runner_settings)
 
-    if (measurement_settings["streams"] == 0 and measurement_settings["starting-streams"] == 0
+    engine = _create_engine(measurement_settings, args)
+    runner_pool = _create_runner_pool(measurement_settings, runner_settings, task, args)
+    counters = StreamCounters(max(measurement_settings["max-streams"],
+                                  measurement_settings["streams"]) or DEFAULT_CAPACITY)
+    counters.write_layout(os.path.join(run_directory, LAYOUT_FILE))
+    metrics = _create_metrics_exporter(counters, args)
+    try:
+        _run_measurement(args, run_directory, measurement_settings, runner_settings, task,
+                         engine, runner_pool, counters, checkpoint, metrics)
+    finally:
+        if metrics:
+            metrics.close()
+        if engine:
+            engine.stop()
+            engine.join()
+        counters.close(release=_stop_sinks())
+        if runner_pool:
+            runner_pool.close()
+
+def _stop_sinks(timeout=10):
+    # A sink writes its counter row until its thread exits
+    sinks = [thread for thread in threading.enumerate() if isinstance(thread, MediaSink)]
+    for sink in sinks:
+        sink.stop()
+    for sink in sinks:
+        Thread.join(sink, timeout)
+    return not any(Thread.is_alive(sink) for sink in sinks)
+
+def _run_measurement(args, run_directory, measurement_settings, runner_settings, task,
+                     engine, runner_pool, counters, checkpoint=None, metrics=None):
+
+    if (checkpoint):
+        starting_streams = checkpoint["starting_streams"]
+    elif (measurement_settings["streams"] == 0 and measurement_settings["starting-streams"] == 0
         and measurement_settings["target-condition"]!="total"):
-        starting_streams = _estimate_starting_streams(args, run_directory, task, measurement_settings)
+        starting_streams = _estimate_starting_streams(args, run_directory, task, measurement_settings,
+                                                      counters, engine)
     else:
         starting_streams = (measurement_settings["streams"] if measurement_settings["streams"]
                             else measurement_settings["starting-streams"])
@@ -467,15 +780,67 @@ def run(args):
 
     search_method = measurement_settings["search-method"]
     current_total_fps = 0
+    search_model = None
+    if search_method == "model":
+        search_model = {"predictions":[]}
+
+    search_complete = False
+
+    if (checkpoint):
+        search = checkpoint["search"]
+        num_streams = search["num_streams"]
+        iteration = search["iteration"]
+        min_failure = search["min_failure"]
+        max_success = search["max_success"]
+        min_failure_iteration = search["min_failure_iteration"]
+        max_success_iteration = search["max_success_iteration"]
+        density = search["density"]
+        first_result = search["first_result"]
+        current_total_fps = search["current_total_fps"]
+        iteration_results = [tuple(result) for result in search["iteration_results"]]
+        iteration_results_map = {streams:success for streams, success in search["iteration_results_map"]}
+        search_model = search["search_model"]
+        search_complete = search["search_complete"]
+
+    def save_checkpoint(complete=False):
+        _write_checkpoint(run_directory,
+                          {"complete":complete,
+                           "measurement_settings":measurement_settings,
+                           "runner_settings":runner_settings,
+                           "starting_streams":starting_streams,
+                           "search":{"num_streams":num_streams,
+                                     "iteration":iteration,
+                                     "min_failure":min_failure,
+                                     "max_success":max_success,
+                                     "min_failure_iteration":min_failure_iteration,
+                                     "max_success_iteration":max_success_iteration,
+                                     "density":density,
+                                     "first_result":first_result,
+                                     "current_total_fps":current_total_fps,
+                                     "iteration_results":iteration_results,
+                                     "iteration_results_map":list(iteration_results_map.items()),
+                                     "search_model":search_model,
+                                     "search_complete":search_complete}})
+
+    active_runners = None
+    if measurement_settings["reuse-runners"]:
+        if measurement_settings["scenario"]["source"] != "memory":
+            print_action("Warning: reuse-runners requires a memory source, restarting runners each iteration")
+        elif not streams_per_process:
+            print_action("Warning: reuse-runners requires streams-per-process, restarting runners each iteration")
+        else:
+            active_runners = []
 
 
-    while ( ((max_success==-1) or
+    while ( (not search_complete) and
+            ((max_success==-1) or
              (min_failure==-1) or
              (min_failure-max_success>1)) and
             (num_streams>=min_streams) and
             (num_streams<=max_streams) and
             (max_iterations==0 or iteration <max_iterations)):
 
+        save_checkpoint()
 
         results = _run_iteration(num_streams,
                                  streams_per_process,
@@ -486,15 +851,22 @@ def run(args):
                                  run_directory,
                                  task,
                                  iteration,
-                                 max_processes)
+                                 max_processes,
+                                 counters,
+                                 engine,
+                                 runner_pool,
+                                 active_runners,
+                                 metrics)
         total_fps = sum ([stream_result.avg for stream_result in results[0]])
 
         success, density_result = _check_density(results, measurement_settings)
         if args.verbose_level>0:
             _print_density_result(density_result,measurement_settings)
 
-        iteration_results.append((density_result,num_streams,results[2]))
+        iteration_results.append((density_result,num_streams,results[2],results[3],results[4]))
         iteration_results_map[num_streams] = success
+        if (metrics):
+            metrics.end_iteration(iteration, num_streams, results[0], success)
 
         if (first_result is None):
             first_result = success
@@ -543,6 +915,17 @@ def run(args):
                 else:
                     num_streams = int(((min_failure - max_success) / 2) + max_success)
 
+        if search_method == "model":
+            search_model["predictions"].append({"iteration":iteration,
+                                                "streams":old_num_streams,
+                                                "total":total_fps})
+            model_streams = _next_model_streams(search_model,
+                                                max_success,
+                                                min_failure,
+                                                measurement_settings)
+            if model_streams is not None:
+                num_streams = model_streams
+
         if (num_streams>max_streams):
             num_streams = max_streams
 
@@ -554,6 +937,12 @@ def run(args):
 
         iteration += 1
 
+    if active_runners:
+        _stop_task(active_runners)
+
+    search_complete = True
+    save_checkpoint()
+
     _write_density_result(density,
                           run_directory,
                           args.pipeline,
@@ -563,8 +952,295 @@ def run(args):
                           max_success_iteration,
                           args.runner,
                           runner_settings,
-                          args)
+                          args,
+                          search_model)
+
+    save_checkpoint(complete=True)
 
+def _fit_throughput_model(observations):
+    # Linear form of T(n) = max_fps * n / (n + k): n / T = n / max_fps + k / max_fps
+    points = [(streams, total) for streams, total in observations if total > 0]
+    if len(set([streams for streams, _ in points])) < 2:
+        return None
+    x = [streams for streams, _ in points]
+    y = [streams / total for streams, total in points]
+    x_mean = mean(x)
+    y_mean = mean(y)
+    slope = (sum([(x_i - x_mean) * (y_i - y_mean) for x_i, y_i in zip(x, y)]) /
+             sum([(x_i - x_mean) ** 2 for x_i in x]))
+    if slope <= 0:
+        return None
+    intercept = y_mean - slope * x_mean
+    max_fps = 1 / slope
+    half_saturation_streams = intercept / slope
+    if (not math.isfinite(max_fps) or not math.isfinite(half_saturation_streams)
+            or half_saturation_streams <= 0):
+        return None
+    return {"max_fps":max_fps,
+            "half_saturation_streams":half_saturation_streams}
+
+def _next_model_streams(search_model, max_success, min_failure, config):
+    observations = [(prediction["streams"], prediction["total"])
+                    for prediction in search_model["predictions"]]
+    model = _fit_throughput_model(observations)
+    if not model:
+        return None
+    search_model.update(model)
+
+    # Largest stream count whose per stream fps stays within target range
+    per_stream_fps = _normalize_range(config, "target-range")[0]
+    predicted = math.floor(model["max_fps"] / per_stream_fps - model["half_saturation_streams"])
+    search_model["predictions"][-1]["predicted_streams"] = predicted
+
+    lower = max_success + 1 if max_success != -1 else 1
+    if min_failure != -1:
+        upper = min_failure - 1
+    else:
+        # Without a failure grow no faster than the doubling of the binary search
+        upper = max(2 * max_success, lower)
+        if config["max-streams"]:
+            upper = min(upper, config["max-streams"])
+    return min(max(predicted, lower), upper)
+
+
+def compare(args):
+    root = args.measurement_directory if args.measurement_directory else args.workspace_root
+    if (args.baseline is None) != (args.candidate is None):
+        args.parser.error("baseline and candidate must be set together")
+    results_index = _open_results_index(args)
+    if results_index:
+        with results_index:
+            if args.reindex or not results_index.results(root):
+                # Import results written before the index existed
+                for run_result in pipebench.compare.index_results(root):
+                    results_index.add_result(run_result.path)
+            results = [pipebench.compare.RunResult(row["pipeline"],
+                                                   row["measurement"],
+                                                   row["runner_settings"],
+                                                   os.path.basename(row["run_directory"]),
+                                                   row["result_path"])
+                       for row in results_index.results(root)]
+    else:
+        results = pipebench.compare.index_results(root)
+    pairs = pipebench.compare.pair_results(results, args.baseline, args.candidate)
+    if not pairs:
+        print_action("No results to compare in {}".format(root))
+        return 0
+
+    report = []
+    rows = []
+    for baseline, candidate in pairs:
+        comparisons = pipebench.compare.compare_metrics(pipebench.compare.load_metrics(baseline.path),
+                                                        pipebench.compare.load_metrics(candidate.path),
+                                                        args.noise_threshold,
+                                                        args.significance,
+                                                        args.permutations)
+        report.append({"baseline": baseline.path,
+                       "candidate": candidate.path,
+                       "metrics": comparisons})
+        for comparison in comparisons:
+            rows.append({"Pipeline": baseline.pipeline,
+                         "Measurement": baseline.measurement,
+                         "Baseline": "{}/{}".format(baseline.runner_settings, baseline.run),
+                         "Candidate": "{}/{}".format(candidate.runner_settings, candidate.run),
+                         "Metric": comparison["metric"],
+                         "Baseline Value": comparison["baseline"],
+                         "Candidate Value": comparison["candidate"],
+                         "Change": ("{:+.2%}".format(comparison["change"])
+                                    if comparison["change"] is not None else None),
+                         "P-Value": comparison["p_value"],
+                         "Status": comparison["status"]})
+
+    print(tabulate(rows, headers="keys", tablefmt="grid", floatfmt=".4f"))
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=4)
+
+    threshold_changes = [row for row in rows if row["Status"] == "threshold"]
+    if threshold_changes:
+        print_action("Changes above the noise threshold, not tested: {}".format(len(threshold_changes)),
+                     ["{} {} {}: {}".format(row["Pipeline"], row["Measurement"], row["Metric"], row["Change"])
+                      for row in threshold_changes])
+
+    regressions = [row for row in rows if row["Status"] == "regression"]
+    if regressions:
+        print_action("Regressions: {}".format(len(regressions)),
+                     ["{} {} {}: {}".format(row["Pipeline"], row["Measurement"], row["Metric"], row["Change"])
+                      for row in regressions])
+        return 1
+    return 0
+
+def _prepare_setup(args):
+    pipeline_path = find_pipeline(args.pipeline, args)
+
+    if (not pipeline_path):
+        raise Exception("Pipeline {} not found in workspace".format(args.pipeline))
+
+    args.pipeline_root = os.path.dirname(pipeline_path)
+
+    measurement_settings, _ = _load_measurement_settings(args)
+
+    task = Task.create_task(measurement_settings, pipeline_path, args)
+
+    media_name = os.path.basename(measurement_settings["media"])
+
+    args.workload_root = os.path.join(args.pipeline_root,
+                                      ".workloads",
+                                      media_name,
+                                      measurement_settings["scenario"]["source"])
+
+    _prepare_workload_root(args)
+
+    return task
+
+def _prepare_steps(pipelines, tasks, workload_cache, reference_cache, forced, args):
+    # Downloads run one after the other, pipelines share models in the workspace
+    steps = OrderedDict()
+    previous_download = None
+
+    def download_step(pipeline_args):
+        # --force applies to workloads, existing pipelines are kept
+        download_args = copy.copy(pipeline_args)
+        download_args.force = False
+        download_args.silent = pipeline_args.verbose_level == 0
+        return lambda: _download_pipeline(download_args.pipeline, download_args)
+
+    def setup_step(pipeline_args):
+        def setup():
+            tasks[pipeline_args.pipeline] = _prepare_setup(pipeline_args)
+        return setup
+
+    def input_step(pipeline_args):
+        step = (pipeline_args.pipeline, "input")
+        return lambda: tasks[pipeline_args.pipeline].prepare_input(pipeline_args.workload_root,
+                                                                   workload_cache,
+                                                                   step in forced)
+
+    def reference_step(pipeline_args):
+        step = (pipeline_args.pipeline, "reference")
+        return lambda: tasks[pipeline_args.pipeline].prepare_reference(pipeline_args.workload_root,
+                                                                       None,
+                                                                       reference_cache,
+                                                                       step in forced)
+
+    def frame_store_step(pipeline_args):
+        return lambda: tasks[pipeline_args.pipeline].prepare_frame_store(pipeline_args.workload_root)
+
+    for pipeline in pipelines:
+        pipeline_args = copy.copy(args)
+        pipeline_args.pipeline = pipeline
+        download = (pipeline, "download")
+        steps[download] = (download_step(pipeline_args),
+                           [previous_download] if previous_download else [])
+        previous_download = download
+        steps[(pipeline, "setup")] = (setup_step(pipeline_args), [download])
+        steps[(pipeline, "input")] = (input_step(pipeline_args), [(pipeline, "setup")])
+        steps[(pipeline, "reference")] = (reference_step(pipeline_args), [(pipeline, "input")])
+        steps[(pipeline, "frame-store")] = (frame_store_step(pipeline_args), [(pipeline, "reference")])
+    return steps
+
+def _shared_dependencies(steps, tasks, workload_cache, reference_cache, forced, first_steps, pipeline):
+    # The first step of a cache key stores the entry, the others wait and link it
+    if pipeline not in tasks:
+        return
+    for step_name, cache, key_function in [("input", workload_cache, tasks[pipeline].workload_key),
+                                           ("reference", reference_cache, tasks[pipeline].reference_key)]:
+        if not cache:
+            continue
+        try:
+            key = key_function(cache)
+        except Exception:
+            continue
+        if key is None:
+            continue
+        step = (pipeline, step_name)
+        first_step = first_steps.setdefault((step_name, key), step)
+        if first_step != step:
+            steps[step][1].append(first_step)
+            forced.discard(step)
+
+def _run_prepare_step(function):
+    start_time = time.time()
+    try:
+        function()
+        error = None
+    except (Exception, SystemExit) as exception:
+        error = exception
+    return time.time() - start_time, error
+
+def prepare(args):
+    if args.all:
+        pipelines = args.pipelines[0]
+    else:
+        pipelines = args.prepare_pipelines
+    if not pipelines:
+        args.parser.error("pipeline list or --all required")
+    unknown = [pipeline for pipeline in pipelines if pipeline not in args.pipelines[0]]
+    if unknown:
+        args.parser.error("Unknown pipelines: {}".format(", ".join(unknown)))
+
+    tasks = {}
+    first_steps = {}
+    workload_cache = _get_workload_cache(args)
+    reference_cache = _get_reference_cache(args)
+    forced = set()
+    if args.force:
+        forced.update((pipeline, step) for pipeline in pipelines for step in ["input", "reference"])
+    steps = _prepare_steps(pipelines, tasks, workload_cache, reference_cache, forced, args)
+    status = {}
+    timings = []
+    workers = max(args.workers, 1)
+
+    print_action("Preparing {} pipelines".format(len(pipelines)),
+                 ["Workers: {}".format(workers)])
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = {}
+        while len(status) < len(steps):
+            for step, (function, dependencies) in steps.items():
+                if step in status or step in running.values():
+                    continue
+                dependency_status = [status.get(dependency) for dependency in dependencies]
+                if any(value in ["failed", "skipped"] for value in dependency_status):
+                    status[step] = "skipped"
+                    timings.append({"Pipeline": step[0],
+                                    "Step": step[1],
+                                    "Seconds": None,
+                                    "Status": "skipped"})
+                elif all(value == "done" for value in dependency_status):
+                    running[executor.submit(_run_prepare_step, function)] = step
+            if not running:
+                continue
+            completed, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in completed:
+                step = running.pop(future)
+                seconds, error = future.result()
+                status[step] = "failed" if error else "done"
+                if error:
+                    print_action("Failed: {} {}".format(*step), [str(error)])
+                elif step[1] == "setup":
+                    _shared_dependencies(steps, tasks, workload_cache, reference_cache,
+                                         forced, first_steps, step[0])
+                timings.append({"Pipeline": step[0],
+                                "Step": step[1],
+                                "Seconds": round(seconds, 2),
+                                "Status": status[step]})
+    wall_time = time.time() - start_time
+
+    order = list(steps.keys())
+    timings.sort(key=lambda timing: order.index((timing["Pipeline"], timing["Step"])))
+    print(tabulate(timings, headers="keys", tablefmt="grid", floatfmt=".2f"))
+
+    step_time = sum(timing["Seconds"] for timing in timings if timing["Seconds"])
+    print_action("Prepare Complete",
+                 ["Wall time: {:.2f}s".format(wall_time),
+                  "Step time: {:.2f}s".format(step_time)])
+
+    if any(value == "failed" for value in status.values()):
+        return 1
+    return 0
 
 def download(args):
     _download_pipeline(args.pipeline,
@@ -578,6 +1254,11 @@ def list_pipeline_runners(pipeline_path):
 
 def list_pipelines(args):
 
+    run_counts = {}
+    results_index = _open_results_index(args)
+    if results_index:
+        with results_index:
+            run_counts = results_index.run_counts()
     descriptions = []
     for pipeline,pipeline_path in zip(args.pipelines[0],args.pipelines[1]):
         pipeline_config = PipelineConfig(pipeline_path,args)
@@ -595,7 +1276,8 @@ def list_pipelines(args):
         descriptions.append({"Pipeline":pipeline,
                              "Task":pipeline_config._namespace.task,
                              "Models":"\n".join(models),
-                             "Runners":"\n".join(runners)})
+                             "Runners":"\n".join(runners),
+                             "Runs":run_counts.get(pipeline, 0)})
 
     print(tabulate(descriptions,headers={'name':'name','models':'models','task':'task'},tablefmt="grid"))
 
@@ -684,7 +1366,17 @@ def _load_workload(args):
     return None
 
 
-def _prepare(task, measurement_settings, args):
+def _get_workload_cache(args):
+    if args.no_workload_cache:
+        return None
+    return ContentCache(args.workload_cache, "workloads")
+
+def _get_reference_cache(args):
+    if args.no_reference_cache:
+        return None
+    return ContentCache(args.workload_cache, "references")
+
+def _prepare_workload_root(args):
 
     if (args.force):
         try:
@@ -714,28 +1406,39 @@ def _prepare(task, measurement_settings, args):
         if (not os.path.isdir(directory)):
             create_directory(directory)
 
+
+def _prepare(task, measurement_settings, args):
+
+    _prepare_workload_root(args)
+
     timeout = None
-    task.prepare(args.workload_root, timeout)
+    task.prepare(args.workload_root,
+                 timeout,
+                 workload_cache=_get_workload_cache(args),
+                 force=args.force,
+                 reference_cache=_get_reference_cache(args))
 
 
-def _print_fps(runners, totals, iteration):
+def _print_fps(runners, totals, iteration, counters):
 
-    results = []
-    output = []
-    stream_index = 0
+    active_sinks = []
     for (sources, sinks, runner_process, _) in runners:
         for index, source in enumerate(sources):
             if (not source or source.is_alive()):
-                stats = sinks[index].get_fps()
-                results.append(stats)
-
-            stream_index+=1
-
-    stream_count = len([stream_result.avg for stream_result in results if stream_result.avg !=0 ])
-    average = mean ([stream_result.avg for stream_result in results])
-    minimum = min  ([stream_result.avg for stream_result in results])
-    maximum = max  ([stream_result.avg for stream_result in results])
-    total = sum ([stream_result.avg for stream_result in results])
+                active_sinks.append(sinks[index])
+
+    # Sinks publish their counters to shared memory, reduce over the
+    # active rows instead of collecting a result per stream
+    active = numpy.array([sink._stream_index for sink in active_sinks], dtype=numpy.intp)
+    averages = counters.column("avg")[active]
+    if (averages.size):
+        stream_count = numpy.count_nonzero(averages)
+        average = averages.mean()
+        minimum = averages.min()
+        maximum = averages.max()
+        total = averages.sum()
+    else:
+        stream_count, average, minimum, maximum, total = 0, 0, 0, 0, 0
 
     print("="*72)
     output = "Iteration   Streams  Processes    Minimum   Average   Maximum      Total"
@@ -751,13 +1454,14 @@ def _print_fps(runners, totals, iteration):
     print(output)
     print("="*72,"\n")
 
-    if (len(runners) == 1):
+    if (len(runners) == 1 and active_sinks):
+        stats = active_sinks[-1].get_fps()
         totals["total"] = stats.fps
         totals["min"] = stats.min
         totals["max"] = stats.max
         totals["avg"] = stats.avg
 
-    return results
+    return active_sinks
 
 known_return_codes = [-9, -15, 0]
 def _check_return_codes(return_codes):
@@ -769,21 +1473,135 @@ def _check_return_codes(return_codes):
         sys.exit(1)
 
 
-def _wait_for_task(runners, duration, iteration=None):
-    results = []
-    return_codes = []
+def _stream_details(runners):
+    details = []
+    for (sources, sinks, runner_process, _) in runners:
+        for source, sink in zip(sources, sinks):
+            details.append(dict(source.get_input_fps() if source else {},
+                                **sink.get_frame_latency()))
+    return details
+
+FPS_SERIES_FILE = "fps-series.npy"
+FPS_SERIES_DTYPE = numpy.dtype([("stream", numpy.int32),
+                                ("time", numpy.float64),
+                                ("frames", numpy.int64)])
+
+def _write_fps_series(runners, target_dir, iteration_directory):
+    series = []
+    for (_, sinks, _, _) in runners:
+        for sink in sinks:
+            times, frames = sink.get_fps_series()
+            stream_series = numpy.empty(len(times), dtype=FPS_SERIES_DTYPE)
+            stream_series["stream"] = sink._stream_index
+            stream_series["time"] = numpy.frombuffer(times, dtype=numpy.float64)
+            stream_series["frames"] = numpy.frombuffer(frames, dtype=numpy.int64)
+            series.append(stream_series)
+    path = os.path.join(iteration_directory, FPS_SERIES_FILE)
+    numpy.save(os.path.join(target_dir, path),
+               numpy.concatenate(series) if series else numpy.empty(0, dtype=FPS_SERIES_DTYPE))
+    return path
+
+def _frame_latency_details(runners):
+    frame_latency = None
+    for (_, sinks, _, _) in runners:
+        for sink in sinks:
+            if sink.frame_times is not None:
+                if frame_latency is None:
+                    frame_latency = LatencyHistogram()
+                frame_latency.merge(sink._frame_latency)
+    return frame_latency.summary() if frame_latency else None
+
+def _spent_alpha(confidence, check):
+    # Spending (1 - confidence) * 6 / (pi^2 * check^2) keeps the error rate of all checks below 1 - confidence
+    return (1 - confidence) * 6 / (math.pi**2 * check**2)
+
+def _confidence_intervals(streams, alpha):
+    # Bonferroni correction so that all stream intervals hold together
+    z = NormalDist().inv_cdf(1 - alpha / (2 * len(streams)))
+    return [(avg - z * error, avg + z * error) for avg, error in streams]
+
+def _early_stop_streams(runners, config):
+    streams = []
+    for (_, sinks, _, _) in runners:
+        for sink in sinks:
+            samples, error = sink.get_sample_error()
+            if (error is None) or (samples < config["early-stop-min-samples"]):
+                return None
+            streams.append((sink.get_fps().avg, error))
+    if not streams:
+        return None
+    return streams
+
+def _check_early_stop(streams, config, check):
+    # Tests the ranges of _check_density with the error rate spent on this check
+    intervals = _confidence_intervals(streams,
+                                      _spent_alpha(config["early-stop-confidence"], check))
+    target_range = _normalize_range(config, "target-range")
+    minimum_range = _normalize_range(config, "minimum-range")
+
+    checks = []
+    if config["target-condition"] == "stream":
+        checks.extend([(interval, target_range) for interval in intervals])
+        if minimum_range and any([high < minimum_range[0] for _, high in intervals]):
+            # Sample minimum is at most the stream average
+            return False
+    else:
+        # Stream intervals hold together, so bounds of their mean and minimum hold too
+        checks.append(((mean([low for low, _ in intervals]), mean([high for _, high in intervals])),
+                       target_range))
+        if minimum_range:
+            checks.append(((min([low for low, _ in intervals]), min([high for _, high in intervals])),
+                           minimum_range))
+
+    if any([high < _min or low > _max for (low, high), (_min, _max) in checks]):
+        return False
+    # Minimum sample fps of a stream can still drop, only an early failure is known
+    if minimum_range and config["target-condition"] == "stream":
+        return None
+    if all([low >= _min and high <= _max for (low, high), (_min, _max) in checks]):
+        return True
+    return None
+
+def _measure_task(runners, duration, counters, iteration=None, measurement_settings=None):
+    active_sinks = []
     start = time.time()
     totals = {}
+    early_stop = None
+    early_stop_checks = 0
+    check_early_stop = (measurement_settings and
+                        measurement_settings["early-stop-confidence"] and
+                        measurement_settings["target-condition"] != "total")
     for (sources, sinks, runner_process, run_directory) in runners:
         for source in sources:
             while(((not source or source.is_alive()) and (runner_process.poll() is None))
-                  and ((time.time()-start) < duration)):
+                  and ((time.time()-start) < duration) and (not early_stop)):
                 if (source):
                     source.join(1)
                 else:
                     time.sleep(1)
-                results = _print_fps(runners, totals, iteration)
+                active_sinks = _print_fps(runners, totals, iteration, counters)
+                streams = _early_stop_streams(runners, measurement_settings) if check_early_stop else None
+                if (streams):
+                    early_stop_checks += 1
+                    success = _check_early_stop(streams, measurement_settings, early_stop_checks)
+                    if (success is not None):
+                        early_stop = {"success":success,
+                                      "elapsed_time":time.time()-start}
+                        print_action("Early stop: iteration {} {} with {} confidence after {:.1f}s".format(
+                            iteration,
+                            "passed" if success else "failed",
+                            measurement_settings["early-stop-confidence"],
+                            early_stop["elapsed_time"]))
 
+    if ("total" in totals):
+        del totals["total"]
+    results = [sink.get_fps() for sink in active_sinks]
+    return results, totals, early_stop
+
+def _stop_task(runners):
+    return_codes = []
+    for (sources, sinks, runner_process, run_directory) in runners:
+        for source in sources:
             if (source):
                 source.stop()
             if (source and source.connected):
@@ -801,10 +1619,12 @@ def _wait_for_task(runners, duration, iteration=None):
                 sink.join(10)
         return_codes.append((runner_process.returncode,run_directory))
 
-    if ("total" in totals):
-        del totals["total"]
     _check_return_codes(return_codes)
-    return results, totals, len(runners)
+
+def _wait_for_task(runners, duration, counters, iteration=None):
+    results, totals, _ = _measure_task(runners, duration, counters, iteration)
+    _stop_task(runners)
+    return results, totals, len(runners), _stream_details(runners)
 
 def _iteration_stats(iteration):
     values = {}
@@ -822,7 +1642,8 @@ def _write_result_json(density,
                        max_success_iteration,
                        runner,
                        runner_settings,
-                       args):
+                       args,
+                       search_model=None):
 
     iteration = results[max_success_iteration]
     values = _iteration_stats(iteration[0])
@@ -839,6 +1660,8 @@ def _write_result_json(density,
     for iteration_index,result in enumerate(results):
         iteration_result = {}
         for stream_index,stream_result in enumerate(result[0]):
+            if stream_index < len(result[3]):
+                stream_result = dict(stream_result, **result[3][stream_index])
             iteration_result[stream_template.format(stream_index)] = stream_result
 
         iteration_values = _iteration_stats(result[0])
@@ -854,6 +1677,7 @@ def _write_result_json(density,
         iteration_result["avg"]=iteration_average
         iteration_result["total"]=iteration_total
         iteration_result["processes"]=iteration_processes
+        iteration_result.update(result[4])
         iteration_results[iteration_template.format(iteration_index)]=iteration_result
 
     result = {args.measurement: {
@@ -869,10 +1693,17 @@ def _write_result_json(density,
         "command_line":subprocess.list2cmdline(sys.argv)
     }}
 
+    if search_model:
+        result[args.measurement]["search_model"] = search_model
+
+    if "efficiency" in iteration[4]:
+        result[args.measurement]["efficiency"] = iteration[4]["efficiency"]
+
     if args.measurement == "latency":
         streams_latency = _get_latency_by_streams(run_directory)
         if streams_latency:
-            result[args.measurement]["streams_latency"] = streams_latency
+            result[args.measurement]["streams_latency"] = [_stream_latency_result(stream_latency)
+                                                           for stream_latency in streams_latency]
             pipeline_aggregate, elements_aggregate = _aggregate_latency(
                 streams_latency)
             result[args.measurement]["aggregate_latency"] = {
@@ -899,85 +1730,49 @@ def _write_result_json(density,
     with open(result_file_name, "w") as result_file:
         json.dump(result, result_file, indent=4)
 
+    results_index = _open_results_index(args)
+    if results_index:
+        with results_index:
+            results_index.add_result(result_file_name, result, args.runner, args.platform)
+
 
 def _get_latency_by_streams(run_directory):
-    streams_latency = []
-    for file in glob.glob("{}/*/*/*".format(run_directory)):
-        if os.path.basename(file) == "latency.log":
-            stream_latency = _read_latency_file(file)
-            if stream_latency:
-                streams_latency.append(_read_latency_file(file))
-    return streams_latency
+    files = [file for file in sorted(glob.glob("{}/*/*/*".format(run_directory)))
+             if os.path.basename(file) == "latency.log"]
+    if len(files) > 1:
+        # Metrics and engine threads are still running, forking them can deadlock
+        with ProcessPoolExecutor(max_workers=min(len(files), os.cpu_count()),
+                                 mp_context=multiprocessing.get_context("forkserver")) as executor:
+            streams_latency = list(executor.map(read_latency_file, files))
+    else:
+        streams_latency = [read_latency_file(file) for file in files]
+    return [stream_latency for stream_latency in streams_latency if stream_latency]
+
+
+def _stream_latency_result(stream_latency):
+    result = stream_latency.summary()
+    elements = stream_latency.element_summaries()
+    if elements:
+        result["elements"] = elements
+    return result
 
 
 def _aggregate_latency(streams_latency):
-    pipelines_latency = copy.deepcopy(streams_latency)
-    elements_latency = [summary.pop("elements")
-                        for summary in pipelines_latency]
     pipeline_aggregate = {}
     elements_aggregate = {}
-    if len(pipelines_latency) == 1:
-        pipeline_aggregate = pipelines_latency[0]
-    elif len(pipelines_latency) > 1:
-        pipeline_aggregate = {
-            "latency": sum([summary["latency"] for summary in pipelines_latency])/(len(pipelines_latency) ** 2),
-            "avg": sum([summary["avg"] for summary in pipelines_latency])/len(pipelines_latency),
-            "min": min([summary["min"] for summary in pipelines_latency]),
-            "max": max([summary["max"] for summary in pipelines_latency])}
-
-    if len(elements_latency) == 1:
-        elements_aggregate = elements_latency[0]
-    elif len(elements_latency) > 1:
-        for key in elements_latency[0]:
-            elements_aggregate[key] = {
-                "element": key,
-                "min": min([summary[key]["min"] for summary in elements_latency]),
-                "max": max([summary[key]["max"] for summary in elements_latency]),
-                "avg": sum([summary[key]["avg"] for summary in elements_latency])/len(elements_latency)
-            }
+    if streams_latency:
+        aggregate = StreamLatency()
+        for stream_latency in streams_latency:
+            aggregate.merge(stream_latency)
+        latencies = [stream_latency.latency for stream_latency in streams_latency
+                     if stream_latency.latency is not None]
+        if latencies:
+            aggregate.latency = sum(latencies)/(len(latencies) ** 2)
+        pipeline_aggregate = aggregate.summary()
+        elements_aggregate = aggregate.element_summaries()
 
     return pipeline_aggregate, elements_aggregate
 
-
-def _read_latency_file(file):
-    elements_latency = {}
-    stream_latency = None
-    for line in reversed(list(open(file))):
-        line_string = line.rstrip()
-        if "latency_tracer_pipeline," in line_string and not stream_latency:
-            stream_latency = {"latency": _get_latency_value(line_string, "latency"),
-                              "avg": _get_latency_value(line_string, "avg"),
-                              "min": _get_latency_value(line_string, "min"),
-                              "max": _get_latency_value(line_string, "max")
-                              }
-
-        if "latency_tracer_element," in line_string:
-            name = _get_latency_value(
-                line_string, "name", "string")
-            if name and name not in elements_latency:
-                elements_latency[name] = {
-                    "element": name,
-                    "avg": _get_latency_value(line_string, "avg"),
-                    "min": _get_latency_value(line_string, "min"),
-                    "max": _get_latency_value(line_string, "max")}
-
-    if stream_latency and elements_latency:
-        stream_latency["elements"] = elements_latency
-    return stream_latency
-
-
-def _get_latency_value(line_string, key="latency", var_type="double"):
-    regex = "[+-]?([0-9]*[.])?[0-9]+"
-    if var_type == "string":
-        regex = "[A-Za-z0-9]+"
-    if key in line_string:
-        pattern = r" {}=\({}\)({})".format(key, var_type, regex)
-        if re.search(pattern, line_string):
-            match = re.search(pattern, line_string)
-            if var_type == "double":
-                return round(float(match.groups(0)[0]), 4)
-            return match.groups(0)[0]
-
 def _write_density_result(density,
                           run_directory,
                           pipeline,
@@ -987,7 +1782,8 @@ def _write_density_result(density,
                           max_success_iteration,
                           runner,
                           runner_settings,
-                          args):
+                          args,
+                          search_model=None):
     _write_result_json(density,
                        run_directory,
                        pipeline,
@@ -997,7 +1793,8 @@ def _write_density_result(density,
                        max_success_iteration,
                        runner,
                        runner_settings,
-                       args)
+                       args,
+                       search_model)
 
     last = []
     second_to_last = []
@@ -0,0 +1,170 @@
+'''
+* Copyright (C) 2019 Intel Corporation.
+*
+* SPDX-License-Identifier: MIT
+'''
+
+import os
+import glob
+import json
+import fnmatch
+import numpy
+from collections import namedtuple
+from pipebench.results_index import run_fields
+
+RESULT_FILE = "result.json"
+LATENCY_STATISTICS = ["avg", "p50", "p90", "p99", "p99.9"]
+
+RunResult = namedtuple("RunResult", ["pipeline", "measurement", "runner_settings", "run", "path"])
+Metric = namedtuple("Metric", ["value", "samples", "higher_is_better"])
+
+
+def _run_result(path):
+    return RunResult(*run_fields(os.path.dirname(os.path.abspath(path))), path)
+
+
+def _run_key(run_result):
+    return "/".join([run_result.pipeline,
+                     run_result.measurement,
+                     run_result.runner_settings,
+                     run_result.run])
+
+
+def index_results(root):
+    paths = glob.glob(os.path.join(root, "*", "measurements", "*", "*", "run-*", RESULT_FILE))
+    return sorted([_run_result(path) for path in paths],
+                  key=lambda run_result: (os.path.getmtime(run_result.path), run_result.run))
+
+
+def select_results(results, selector):
+    if os.path.isdir(selector):
+        selector = os.path.join(selector, RESULT_FILE)
+    if os.path.isfile(selector):
+        return [_run_result(selector)]
+    return [run_result for run_result in results
+            if fnmatch.fnmatch(_run_key(run_result), selector) or
+            fnmatch.fnmatch(_run_key(run_result), selector.rstrip("/") + "/*")]
+
+
+def _latest(results):
+    latest = {}
+    for run_result in results:
+        latest[(run_result.pipeline, run_result.measurement)] = run_result
+    return latest
+
+
+def pair_results(results, baseline=None, candidate=None):
+    # Without selectors the latest run of each runner settings is compared to the run before it
+    if baseline is None and candidate is None:
+        groups = {}
+        for run_result in results:
+            groups.setdefault(run_result[:3], []).append(run_result)
+        return [(runs[-2], runs[-1]) for runs in groups.values() if len(runs) > 1]
+    baselines = select_results(results, baseline)
+    candidates = select_results(results, candidate)
+    if len(baselines) == 1 and len(candidates) == 1:
+        return [(baselines[0], candidates[0])]
+    latest_baselines = _latest(baselines)
+    latest_candidates = _latest(candidates)
+    return [(latest_baselines[key], latest_candidates[key])
+            for key in latest_baselines if key in latest_candidates]
+
+
+def _chosen_iteration(result):
+    iterations = list(result.get("iterations", {}).values())
+    for iteration in iterations:
+        if (iteration.get("streams") == result.get("streams") and
+                iteration.get("total") == result.get("total")):
+            return iteration
+    return iterations[-1] if iterations else {}
+
+
+def _stream_entries(iteration):
+    return [value for key, value in iteration.items() if key.startswith("Stream: ")]
+
+
+def load_metrics(path):
+    with open(path) as result_file:
+        document = json.load(result_file)
+    metrics = {}
+    for result in document.values():
+        iteration = _chosen_iteration(result)
+        streams = _stream_entries(iteration)
+        metrics["density"] = Metric(result.get("streams"), None, True)
+        metrics["total_fps"] = Metric(result.get("total"), None, True)
+        stream_fps = [stream["avg"][0] for stream in streams if "avg" in stream]
+        if stream_fps:
+            metrics["stream_fps"] = Metric(numpy.mean(stream_fps), stream_fps, True)
+
+        pipeline_latency = result.get("aggregate_latency", {}).get("pipeline(s)", {})
+        streams_latency = result.get("streams_latency", [])
+        for statistic in LATENCY_STATISTICS:
+            if pipeline_latency.get(statistic) is not None:
+                samples = [stream[statistic] for stream in streams_latency
+                           if stream.get(statistic) is not None]
+                metrics["latency_{}".format(statistic)] = Metric(pipeline_latency[statistic],
+                                                                 samples or None,
+                                                                 False)
+
+        frame_latency = iteration.get("frame_latency", {})
+        for statistic in LATENCY_STATISTICS:
+            if frame_latency.get(statistic) is not None:
+                samples = [stream["frame_latency"][statistic] for stream in streams
+                           if stream.get("frame_latency", {}).get(statistic) is not None]
+                metrics["frame_latency_{}".format(statistic)] = Metric(frame_latency[statistic],
+                                                                       samples or None,
+                                                                       False)
+    return metrics
+
+
+def permutation_test(baseline, candidate, permutations=10000, seed=0):
+    baseline = numpy.asarray(baseline, dtype=numpy.float64)
+    candidate = numpy.asarray(candidate, dtype=numpy.float64)
+    combined = numpy.concatenate([baseline, candidate])
+    observed = abs(candidate.mean() - baseline.mean())
+    generator = numpy.random.default_rng(seed)
+    extreme = 0
+    batch_size = 1000
+    for start in range(0, permutations, batch_size):
+        batch = min(batch_size, permutations - start)
+        shuffled = generator.permuted(numpy.tile(combined, (batch, 1)), axis=1)
+        differences = (shuffled[:, len(baseline):].mean(axis=1) -
+                       shuffled[:, :len(baseline)].mean(axis=1))
+        # Tolerance so that ties with the observed difference count as extreme
+        extreme += numpy.count_nonzero(numpy.abs(differences) >= observed - 1e-12)
+    return (extreme + 1) / (permutations + 1)
+
+
+def compare_metrics(baseline, candidate, noise_threshold, significance, permutations):
+    # Metrics without per stream samples can't be permutation tested
+    comparisons = []
+    for name, baseline_metric in baseline.items():
+        candidate_metric = candidate.get(name)
+        if (candidate_metric is None or
+                baseline_metric.value is None or candidate_metric.value is None):
+            continue
+        change = None
+        if baseline_metric.value:
+            change = (candidate_metric.value - baseline_metric.value) / abs(baseline_metric.value)
+        p_value = None
+        if (baseline_metric.samples and candidate_metric.samples and
+                len(baseline_metric.samples) + len(candidate_metric.samples) > 2):
+            p_value = permutation_test(baseline_metric.samples,
+                                       candidate_metric.samples,
+                                       permutations)
+        status = "ok"
+        if change is not None and abs(change) > noise_threshold:
+            if p_value is None:
+                status = "threshold"
+            elif p_value < significance:
+                better = (change > 0) == baseline_metric.higher_is_better
+                status = "improvement" if better else "regression"
+            else:
+                status = "not significant"
+        comparisons.append({"metric": name,
+                            "baseline": baseline_metric.value,
+                            "candidate": candidate_metric.value,
+                            "change": change,
+                            "p_value": p_value,
+                            "status": status})
+    return comparisons
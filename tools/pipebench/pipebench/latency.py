@@ -0,0 +1,141 @@
+'''
+* Copyright (C) 2019 Intel Corporation.
+*
+* SPDX-License-Identifier: MIT
+'''
+
+import re
+import math
+
+PERCENTILES = [50, 90, 99, 99.9]
+
+# Relative error of a reported percentile
+HISTOGRAM_PRECISION = 0.01
+
+PIPELINE_TRACER = "latency_tracer_pipeline,"
+ELEMENT_TRACER = "latency_tracer_element,"
+
+NUMBER = r"([-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)"
+FRAME_LATENCY_PATTERN = re.compile(r" frame_latency=\(double\)" + NUMBER)
+LATENCY_PATTERN = re.compile(r" latency=\(double\)" + NUMBER)
+NAME_PATTERN = re.compile(r" name=\(string\)([^,;\s]+)")
+
+
+# Bucket width grows with the value, percentiles are within HISTOGRAM_PRECISION
+class LatencyHistogram(object):
+
+    def __init__(self, precision=HISTOGRAM_PRECISION):
+        self._log_base = math.log1p(precision)
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        if value > 0:
+            index = math.floor(math.log(value) / self._log_base)
+        else:
+            index = None
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        return self
+
+    def _bucket_value(self, index):
+        if index is None:
+            return 0
+        # Geometric center of the bucket
+        return math.exp((index + 0.5) * self._log_base)
+
+    def percentile(self, percentile):
+        if not self.count:
+            return None
+        rank = math.ceil(self.count * percentile / 100)
+        seen = 0
+        for index in sorted(self.buckets, key=lambda index: -math.inf if index is None else index):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(max(self._bucket_value(index), self.min), self.max)
+        return self.max
+
+    def summary(self):
+        result = {"avg": self.total / self.count if self.count else None,
+                  "min": self.min,
+                  "max": self.max}
+        for percentile in PERCENTILES:
+            result["p{:g}".format(percentile)] = self.percentile(percentile)
+        for key, value in result.items():
+            if value is not None:
+                result[key] = round(value, 4)
+        result["frames"] = self.count
+        return result
+
+
+class StreamLatency(object):
+
+    def __init__(self):
+        self.pipeline = LatencyHistogram()
+        self.elements = {}
+        self.latency = None
+
+    def merge(self, other):
+        self.pipeline.merge(other.pipeline)
+        for name, histogram in other.elements.items():
+            self.elements.setdefault(name, LatencyHistogram()).merge(histogram)
+        return self
+
+    def summary(self):
+        result = {"latency": self.latency}
+        result.update(self.pipeline.summary())
+        return result
+
+    def element_summaries(self):
+        return {name: dict({"element": name}, **histogram.summary())
+                for name, histogram in self.elements.items()}
+
+
+def _frame_latency(line):
+    match = FRAME_LATENCY_PATTERN.search(line)
+    if not match:
+        # Older tracers only report the running latency
+        match = LATENCY_PATTERN.search(line)
+    if match:
+        return float(match.group(1))
+    return None
+
+
+def read_latency_file(path):
+    stream_latency = StreamLatency()
+    with open(path, errors="replace") as latency_file:
+        for line in latency_file:
+            if PIPELINE_TRACER in line:
+                value = _frame_latency(line)
+                if value is not None:
+                    stream_latency.pipeline.add(value)
+                match = LATENCY_PATTERN.search(line)
+                if match:
+                    stream_latency.latency = round(float(match.group(1)), 4)
+            elif ELEMENT_TRACER in line:
+                name = NAME_PATTERN.search(line)
+                value = _frame_latency(line)
+                if name and value is not None:
+                    stream_latency.elements.setdefault(name.group(1),
+                                                       LatencyHistogram()).add(value)
+    if not stream_latency.pipeline.count:
+        return None
+    return stream_latency
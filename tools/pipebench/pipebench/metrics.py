@@ -0,0 +1,178 @@
+'''
+* Copyright (C) 2019 Intel Corporation.
+*
+* SPDX-License-Identifier: MIT
+'''
+
+import os
+import math
+import socketserver
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from threading import Event
+from threading import Lock
+from threading import Thread
+from pipebench.resources import ProcessTreeSampler
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_ADDRESS = "127.0.0.1"
+RESOURCE_INTERVAL = 1.0
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{{{}}}".format(",".join(['{}="{}"'.format(name, value)
+                                     for name, value in labels.items()]))
+
+
+def _format_metric(lines, name, help_text, samples, metric_type="gauge"):
+    lines.append("# HELP {} {}".format(name, help_text))
+    lines.append("# TYPE {} {}".format(name, metric_type))
+    for labels, value in samples:
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            continue
+        lines.append("{}{} {}".format(name, _labels(labels), value))
+
+
+# Stream fps is read from the shared counters on request, adding no work to the measurement loop
+class MetricsExporter(object):
+
+    def __init__(self, counters, port=None, socket_path=None, address=DEFAULT_ADDRESS,
+                 resource_interval=RESOURCE_INTERVAL):
+        self._counters = counters
+        self._lock = Lock()
+        self._servers = []
+        self._socket_path = socket_path
+        self._iteration = None
+        self._streams = 0
+        self._runners = []
+        self._samplers = {}
+        self._resources = {}
+        self._completed = []
+        self._stopped = Event()
+
+        exporter = self
+
+        class HttpHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        class SocketHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                self.wfile.write(exporter.render().encode())
+
+        if port is not None:
+            self._servers.append(ThreadingHTTPServer((address, port), HttpHandler))
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self._servers.append(socketserver.ThreadingUnixStreamServer(socket_path, SocketHandler))
+        for server in self._servers:
+            server.daemon_threads = True
+            Thread(target=server.serve_forever, daemon=True).start()
+        # cpu_percent is relative to the previous sample, only one thread samples
+        self._resource_thread = Thread(target=self._sample_resources,
+                                       args=(resource_interval,),
+                                       daemon=True)
+        self._resource_thread.start()
+
+    def _sample_resources(self, interval):
+        while not self._stopped.wait(interval):
+            with self._lock:
+                samplers = dict(self._samplers)
+            resources = {pid: sampler.sample() for pid, sampler in samplers.items()}
+            with self._lock:
+                self._resources = {pid: sample for pid, sample in resources.items()
+                                   if pid in self._samplers}
+
+    def start_iteration(self, iteration, num_streams, runners):
+        with self._lock:
+            self._iteration = iteration
+            self._streams = num_streams
+            self._runners = list(runners)
+            self._samplers = {runner_process.pid: self._samplers.get(runner_process.pid,
+                                                                     ProcessTreeSampler(runner_process.pid))
+                              for (_, _, runner_process, _) in self._runners}
+
+    def end_iteration(self, iteration, num_streams, results, success):
+        fps = [stream_result.avg for stream_result in results]
+        with self._lock:
+            self._completed.append({"iteration": iteration,
+                                    "streams": num_streams,
+                                    "total": sum(fps),
+                                    "avg": sum(fps) / len(fps) if fps else 0,
+                                    "success": int(bool(success))})
+
+    def render(self):
+        with self._lock:
+            iteration = self._iteration
+            streams = self._streams
+            runners = self._runners
+            resources = dict(self._resources)
+            completed = list(self._completed)
+
+        lines = []
+        _format_metric(lines, "pipebench_iteration", "Index of the current iteration",
+                       [({}, iteration)])
+        _format_metric(lines, "pipebench_iteration_streams", "Streams of the current iteration",
+                       [({}, streams)])
+        _format_metric(lines, "pipebench_iteration_processes", "Runner processes of the current iteration",
+                       [({}, len(runners))])
+        _format_metric(lines, "pipebench_iterations_completed", "Number of completed iterations",
+                       [({}, len(completed))], "counter")
+
+        stream_indices = [sink._stream_index
+                          for (_, sinks, _, _) in runners for sink in sinks]
+        frames = self._counters.column("frames")
+        sample_fps = self._counters.column("fps")
+        avg_fps = self._counters.column("avg")
+        _format_metric(lines, "pipebench_stream_frames_total", "Frames received by the stream",
+                       [({"stream": index}, int(frames[index])) for index in stream_indices],
+                       "counter")
+        _format_metric(lines, "pipebench_stream_sample_fps", "Fps of the last sample of the stream",
+                       [({"stream": index}, float(sample_fps[index])) for index in stream_indices])
+        _format_metric(lines, "pipebench_stream_fps", "Average fps of the stream in the measured window",
+                       [({"stream": index}, float(avg_fps[index])) for index in stream_indices])
+
+        for name, help_text, key in [("pipebench_iteration_total_fps", "Total fps of a completed iteration", "total"),
+                                     ("pipebench_iteration_avg_fps", "Average stream fps of a completed iteration", "avg"),
+                                     ("pipebench_iteration_result_streams", "Streams of a completed iteration", "streams"),
+                                     ("pipebench_iteration_success", "1 if a completed iteration met the target", "success")]:
+            _format_metric(lines, name, help_text,
+                           [({"iteration": "{:04d}".format(result["iteration"])}, result[key])
+                            for result in completed])
+
+        runner_resources = []
+        for process_index, (_, _, runner_process, _) in enumerate(runners):
+            sample = resources.get(runner_process.pid)
+            if sample:
+                runner_resources.append(({"process": "{:04d}".format(process_index),
+                                          "pid": runner_process.pid}, sample))
+        for name, help_text, key in [("pipebench_runner_cpu_percent", "Cpu utilization of the runner process tree", "cpu_percent"),
+                                     ("pipebench_runner_rss_bytes", "Resident memory of the runner process tree", "rss"),
+                                     ("pipebench_runner_threads", "Threads of the runner process tree", "threads")]:
+            _format_metric(lines, name, help_text,
+                           [(labels, sample[key]) for labels, sample in runner_resources])
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        self._stopped.set()
+        self._resource_thread.join()
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers = []
+        if self._socket_path and os.path.exists(self._socket_path):
+            os.unlink(self._socket_path)
@@ -0,0 +1,214 @@
+'''
+* Copyright (C) 2019 Intel Corporation.
+*
+* SPDX-License-Identifier: MIT
+'''
+
+import os
+import glob
+import time
+import numpy
+import psutil
+from threading import Thread
+from threading import Event
+
+PROCESS_SAMPLE_DTYPE = numpy.dtype([("time", numpy.float64),
+                                    ("process", numpy.int32),
+                                    ("cpu_percent", numpy.float64),
+                                    ("rss", numpy.int64),
+                                    ("threads", numpy.int32),
+                                    ("voluntary_context_switches", numpy.int64),
+                                    ("involuntary_context_switches", numpy.int64)])
+
+
+class ProcessTreeSampler(object):
+
+    def __init__(self, pid):
+        self.pid = pid
+        self._processes = {}
+
+    def _tree(self):
+        try:
+            root = psutil.Process(self.pid)
+            tree = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return []
+        processes = {}
+        for process in tree:
+            # Reuse the cached object so that cpu_percent has a baseline
+            processes[process.pid] = self._processes.get(process.pid, process)
+        self._processes = processes
+        return list(processes.values())
+
+    def sample(self):
+        result = {"processes": 0,
+                  "cpu_percent": 0.0,
+                  "rss": 0,
+                  "threads": 0,
+                  "voluntary_context_switches": 0,
+                  "involuntary_context_switches": 0}
+        for process in self._tree():
+            try:
+                with process.oneshot():
+                    cpu_percent = process.cpu_percent(None)
+                    rss = process.memory_info().rss
+                    threads = process.num_threads()
+                    context_switches = process.num_ctx_switches()
+            except psutil.Error:
+                continue
+            result["processes"] += 1
+            result["cpu_percent"] += cpu_percent
+            result["rss"] += rss
+            result["threads"] += threads
+            result["voluntary_context_switches"] += context_switches.voluntary
+            result["involuntary_context_switches"] += context_switches.involuntary
+        if not result["processes"]:
+            return None
+        return result
+
+
+RAPL_ROOT = "/sys/class/powercap"
+
+
+# Only package domains are read, their sub domains are included in the package energy
+class EnergyMeter(object):
+
+    def __init__(self, root=RAPL_ROOT):
+        self._domains = []
+        for path in sorted(glob.glob(os.path.join(root, "intel-rapl:*"))):
+            if os.path.basename(path).count(":") != 1:
+                continue
+            try:
+                with open(os.path.join(path, "max_energy_range_uj")) as range_file:
+                    max_energy = int(range_file.read())
+                self._read_domain(path)
+            except (OSError, ValueError):
+                continue
+            self._domains.append((path, max_energy))
+        self.available = bool(self._domains)
+
+    def _read_domain(self, path):
+        with open(os.path.join(path, "energy_uj")) as energy_file:
+            return int(energy_file.read())
+
+    def read(self):
+        if not self.available:
+            return None
+        try:
+            return time.time(), [self._read_domain(path) for path, _ in self._domains]
+        except (OSError, ValueError):
+            return None
+
+    def energy(self, start, end):
+        if start is None or end is None:
+            return None
+        total = 0
+        for (_, max_energy), start_energy, end_energy in zip(self._domains, start[1], end[1]):
+            if end_energy < start_energy:
+                # Counter wrapped
+                end_energy += max_energy
+            total += end_energy - start_energy
+        return total / 1e6
+
+
+def _range(values):
+    if not len(values):
+        return None
+    return {"avg": round(float(numpy.mean(values)), 4),
+            "max": round(float(numpy.max(values)), 4)}
+
+
+class ResourceMonitor(Thread):
+
+    def __init__(self, processes, interval=1.0, *args, **kwargs):
+        self._samplers = [(process_index, ProcessTreeSampler(pid))
+                          for process_index, pid in processes]
+        self._interval = interval
+        self._stopped = Event()
+        self._process_samples = []
+        self._core_samples = []
+        self._memory_samples = []
+        super().__init__(*args, daemon=True, **kwargs)
+
+    def _sample(self):
+        current_time = time.time()
+        for process_index, sampler in self._samplers:
+            sample = sampler.sample()
+            if sample:
+                self._process_samples.append((current_time,
+                                              process_index,
+                                              sample["cpu_percent"],
+                                              sample["rss"],
+                                              sample["threads"],
+                                              sample["voluntary_context_switches"],
+                                              sample["involuntary_context_switches"]))
+        self._core_samples.append([current_time] + psutil.cpu_percent(None, percpu=True))
+        self._memory_samples.append((current_time, psutil.virtual_memory().percent))
+
+    def run(self):
+        # First cpu_percent calls only set the baseline
+        for _, sampler in self._samplers:
+            sampler.sample()
+        psutil.cpu_percent(None, percpu=True)
+        while not self._stopped.wait(self._interval):
+            self._sample()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def process_samples(self):
+        return numpy.array(self._process_samples, dtype=PROCESS_SAMPLE_DTYPE)
+
+    def core_samples(self):
+        return numpy.array(self._core_samples, dtype=numpy.float64)
+
+    def memory_samples(self):
+        return numpy.array(self._memory_samples, dtype=numpy.float64).reshape(-1, 2)
+
+    def save(self, path):
+        numpy.savez(path,
+                    processes=self.process_samples(),
+                    cores=self.core_samples(),
+                    memory=self.memory_samples())
+
+    def summary(self, start_time=None):
+        # Context switches are the increase over the window, other statistics are summed over runners
+        processes = self.process_samples()
+        cores = self.core_samples()
+        memory = self.memory_samples()
+        if start_time is not None:
+            processes = processes[processes["time"] >= start_time]
+            memory = memory[memory[:, 0] >= start_time]
+            if len(cores):
+                cores = cores[cores[:, 0] >= start_time]
+        if not len(processes):
+            return None
+        times, inverse = numpy.unique(processes["time"], return_inverse=True)
+        totals = {}
+        for field in ["cpu_percent", "rss", "threads"]:
+            totals[field] = numpy.bincount(inverse, weights=processes[field], minlength=len(times))
+        context_switches = {}
+        for field in ["voluntary_context_switches", "involuntary_context_switches"]:
+            increase = 0
+            for process_index in numpy.unique(processes["process"]):
+                values = processes[field][processes["process"] == process_index]
+                increase += int(values[-1] - values[0])
+            context_switches[field] = increase
+        result = {"samples": len(times),
+                  "duration": round(float(times[-1] - times[0]), 4),
+                  "cpu_percent": _range(totals["cpu_percent"]),
+                  "rss": _range(totals["rss"]),
+                  "threads": _range(totals["threads"])}
+        for field, increase in context_switches.items():
+            result[field] = increase
+            result[field + "_per_second"] = (round(increase / result["duration"], 4)
+                                             if result["duration"] else None)
+        if len(cores):
+            core_averages = cores[:, 1:].mean(axis=0)
+            result["core_utilization"] = {"avg": round(float(core_averages.mean()), 4),
+                                          "max": round(float(core_averages.max()), 4),
+                                          "cores": [round(float(value), 4) for value in core_averages]}
+        if len(memory):
+            result["system_memory_percent"] = _range(memory[:, 1])
+        return result
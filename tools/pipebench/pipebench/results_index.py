@@ -0,0 +1,162 @@
+'''
+* Copyright (C) 2019 Intel Corporation.
+*
+* SPDX-License-Identifier: MIT
+'''
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+RESULTS_INDEX_FILE = ".results-index.db"
+
+# systeminfo sections that identify the system under test
+SYSTEMINFO_FINGERPRINT = ["hostname", "motherboard", "cpu", "gpu", "memory", "bios", "os", "opencl"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_directory TEXT PRIMARY KEY,
+    target_directory TEXT NOT NULL,
+    pipeline TEXT,
+    measurement TEXT,
+    runner TEXT,
+    runner_settings TEXT,
+    run_number INTEGER,
+    platform TEXT,
+    settings_hash TEXT,
+    systeminfo_fingerprint TEXT,
+    result_path TEXT,
+    streams INTEGER,
+    total REAL,
+    avg REAL,
+    min REAL,
+    max REAL,
+    processes INTEGER,
+    started REAL,
+    completed REAL
+);
+CREATE INDEX IF NOT EXISTS runs_target ON runs (target_directory, run_number);
+CREATE INDEX IF NOT EXISTS runs_pipeline ON runs (pipeline, measurement, runner_settings);
+"""
+
+
+def run_fields(run_directory):
+    # <pipeline>/measurements/<measurement>/<runner-settings>/run-NNNN
+    parts = os.path.abspath(run_directory).split(os.sep)
+    return parts[-5], parts[-3], parts[-2], parts[-1]
+
+
+def _run_number(run):
+    try:
+        return int(run.replace("run-", ""))
+    except ValueError:
+        return None
+
+
+def _hash(document):
+    return hashlib.sha256(json.dumps(document, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def systeminfo_fingerprint(systeminfo_path):
+    try:
+        with open(systeminfo_path) as systeminfo_file:
+            systeminfo = json.load(systeminfo_file)
+    except (OSError, ValueError):
+        return None
+    fingerprint = {key: systeminfo.get(key) for key in SYSTEMINFO_FINGERPRINT}
+    if isinstance(fingerprint["cpu"], dict):
+        fingerprint["cpu"] = {key: value for key, value in fingerprint["cpu"].items()
+                              if key != "Benchmark"}
+    return _hash(fingerprint)
+
+
+class ResultsIndex(object):
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(path, timeout=60)
+        self._connection.row_factory = sqlite3.Row
+        with self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def next_run_number(self, target_directory):
+        row = self._connection.execute(
+            "SELECT MAX(run_number) FROM runs WHERE target_directory = ?",
+            (os.path.abspath(target_directory),)).fetchone()
+        if row[0] is None:
+            return None
+        return row[0] + 1
+
+    def add_run(self, run_directory, runner=None, platform=None):
+        run_directory = os.path.abspath(run_directory)
+        pipeline, measurement, runner_settings, run = run_fields(run_directory)
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO runs (run_directory, target_directory, pipeline, measurement,"
+                " runner, runner_settings, run_number, platform, started)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_directory, os.path.dirname(run_directory), pipeline, measurement,
+                 runner if runner else runner_settings.split(".")[0], runner_settings,
+                 _run_number(run), platform, time.time()))
+
+    def remove_runs(self, target_directory):
+        with self._connection:
+            self._connection.execute("DELETE FROM runs WHERE target_directory = ?",
+                                     (os.path.abspath(target_directory),))
+
+    def add_result(self, result_path, result=None, runner=None, platform=None):
+        result_path = os.path.abspath(result_path)
+        run_directory = os.path.dirname(result_path)
+        if result is None:
+            with open(result_path) as result_file:
+                result = json.load(result_file)
+        if self._connection.execute("SELECT 1 FROM runs WHERE run_directory = ?",
+                                    (run_directory,)).fetchone() is None:
+            self.add_run(run_directory, runner, platform)
+        for measurement_result in result.values():
+            settings_hash = _hash({"measurement_settings": measurement_result.get("measurement_settings"),
+                                   "runner_settings": measurement_result.get("runner_settings")})
+            with self._connection:
+                self._connection.execute(
+                    "UPDATE runs SET settings_hash = ?, systeminfo_fingerprint = ?, result_path = ?,"
+                    " streams = ?, total = ?, avg = ?, min = ?, max = ?, processes = ?, completed = ?"
+                    " WHERE run_directory = ?",
+                    (settings_hash,
+                     systeminfo_fingerprint(os.path.join(run_directory, "systeminfo.json")),
+                     result_path,
+                     measurement_result.get("streams"),
+                     measurement_result.get("total"),
+                     measurement_result.get("avg"),
+                     measurement_result.get("min"),
+                     measurement_result.get("max"),
+                     measurement_result.get("processes"),
+                     os.path.getmtime(result_path),
+                     run_directory))
+
+    def results(self, root=None, pipeline=None):
+        query = "SELECT * FROM runs WHERE result_path IS NOT NULL"
+        parameters = []
+        if root:
+            query += " AND run_directory LIKE ? ESCAPE '\\'"
+            prefix = os.path.join(os.path.abspath(root), "")
+            parameters.append(prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if pipeline:
+            query += " AND pipeline = ?"
+            parameters.append(pipeline)
+        query += " ORDER BY completed, run_number"
+        return self._connection.execute(query, parameters).fetchall()
+
+    def run_counts(self):
+        return dict(self._connection.execute(
+            "SELECT pipeline, COUNT(*) FROM runs WHERE result_path IS NOT NULL GROUP BY pipeline").fetchall())
@@ -0,0 +1,85 @@
+'''
+* Copyright (C) 2019-2020 Intel Corporation.
+*
+* SPDX-License-Identifier: BSD-3-Clause
+'''
+
+import os
+import numpy
+
+# Bytes scanned per chunk, bounds the temporary arrays of large streams
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# NAL unit types that start an access unit when they precede its first slice
+# H.264 7.4.1.2.3: SEI, SPS, PPS, access unit delimiter and 14-18
+H264_PREFIX_TYPES = [6, 7, 8, 9, 14, 15, 16, 17, 18]
+# H.264 slice types whose header starts with first_mb_in_slice
+H264_SLICE_TYPES = [1, 2, 5]
+
+# H.265 7.4.2.4.4: VPS, SPS, PPS, access unit delimiter, prefix SEI, 41-44 and 48-55
+H265_PREFIX_TYPES = [32, 33, 34, 35, 39, 41, 42, 43, 44] + list(range(48, 56))
+# H.265 VCL types, their header starts with first_slice_segment_in_pic_flag
+H265_SLICE_TYPES = list(range(0, 32))
+
+NAL_HEADER_SIZES = {"video/x-h264": 1,
+                    "video/x-h265": 2}
+
+
+def find_start_codes(data, chunk_size=CHUNK_SIZE):
+    positions = []
+    for start in range(0, len(data), chunk_size):
+        # Two extra bytes so that start codes crossing the chunk end are found once
+        view = numpy.asarray(data[start:start + chunk_size + 2])
+        if len(view) < 3:
+            break
+        matches = numpy.flatnonzero((view[2:] == 1) & (view[1:-1] == 0) & (view[:-2] == 0))
+        positions.append(matches + start)
+    if not positions:
+        return numpy.zeros(0, dtype=numpy.int64)
+    return numpy.concatenate(positions).astype(numpy.int64)
+
+
+def _byte_at(data, positions):
+    valid = positions < len(data)
+    values = numpy.zeros(len(positions), dtype=numpy.uint8)
+    values[valid] = data[positions[valid]]
+    return values
+
+
+def access_units(data, media_type):
+    # An access unit starts at its first prefix NAL unit or at its first slice
+    if media_type not in NAL_HEADER_SIZES:
+        raise Exception("Unsupported Media Type: {}".format(media_type))
+
+    start_codes = find_start_codes(data)
+    if not len(start_codes):
+        return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+
+    header = _byte_at(data, start_codes + 3)
+    # First bit of the slice header follows the NAL unit header
+    first_slice = (_byte_at(data, start_codes + 3 + NAL_HEADER_SIZES[media_type]) & 0x80) != 0
+
+    if media_type == "video/x-h264":
+        nal_types = header & 0x1F
+        prefix = numpy.isin(nal_types, H264_PREFIX_TYPES)
+        first_slice &= numpy.isin(nal_types, H264_SLICE_TYPES)
+    else:
+        nal_types = (header >> 1) & 0x3F
+        prefix = numpy.isin(nal_types, H265_PREFIX_TYPES)
+        first_slice &= numpy.isin(nal_types, H265_SLICE_TYPES)
+
+    previous_prefix = numpy.zeros(len(prefix), dtype=bool)
+    previous_prefix[1:] = prefix[:-1]
+    unit_starts = (prefix | first_slice) & ~previous_prefix
+
+    offsets = start_codes[unit_starts]
+    leading_zero = (offsets > 0) & (_byte_at(data, numpy.maximum(offsets - 1, 0)) == 0)
+    offsets = offsets - leading_zero
+    sizes = numpy.diff(numpy.append(offsets, len(data)))
+    return offsets, sizes
+
+
+def scan_access_units(path, media_type):
+    if not os.path.getsize(path):
+        return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+    return access_units(numpy.memmap(path, dtype=numpy.uint8, mode="r"), media_type)
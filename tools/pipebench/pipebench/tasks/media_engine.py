@@ -0,0 +1,312 @@
+'''
+* Copyright (C) 2019-2020 Intel Corporation.
+*
+* SPDX-License-Identifier: BSD-3-Clause
+'''
+
+import os
+import errno
+import heapq
+import itertools
+import resource
+import selectors
+import time
+from threading import Thread
+from threading import Lock
+from pipebench.util import print_action
+from pipebench.tasks.media_util import set_pipe_size
+from pipebench.tasks.media_util import READ_SIZE
+
+# Upper bound on consecutive writes to one stream per event so that
+# uncapped streams can not starve the rest of the loop.
+MAX_WRITES_PER_EVENT = 16
+
+
+def _raise_file_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError) as error:
+            print("Can't raise open file limit: {}".format(error))
+
+
+class _SourceStream(object):
+
+    def __init__(self, source):
+        self.source = source
+        self.fd = None
+        self.data_fd = None
+        self.count = 0
+        self.due = 0
+        self.buffers = []
+        self.splice = None
+        self.pending_frames = 0
+        self.registered = False
+        self.closed = False
+
+
+# Replaces the blocking read and write loops of sources and sinks with one selector
+class MediaEngine(Thread):
+
+    def __init__(self, poll_interval=0.05, verbose_level=0, *args, **kwargs):
+        self._selector = selectors.DefaultSelector()
+        self._lock = Lock()
+        self._new_sources = []
+        self._new_sinks = []
+        self._opening = []
+        self._waiting_sinks = []
+        self._sources = []
+        self._sinks = {}
+        self._timers = []
+        self._sequence = itertools.count()
+        self._poll_interval = poll_interval
+        self._verbose_level = verbose_level
+        self._stopped = False
+        _raise_file_limit()
+        super().__init__(*args, **kwargs)
+
+    def add_source(self, source):
+        with self._lock:
+            self._new_sources.append(_SourceStream(source))
+
+    def add_sink(self, sink):
+        with self._lock:
+            self._new_sinks.append(sink)
+
+    def stop(self):
+        self._stopped = True
+
+    def _schedule(self, stream):
+        heapq.heappush(self._timers, (stream.due, next(self._sequence), stream))
+
+    def _want_write(self, stream, enabled):
+        if enabled and not stream.registered:
+            self._selector.register(stream.fd, selectors.EVENT_WRITE, stream)
+            stream.registered = True
+        elif not enabled and stream.registered:
+            self._selector.unregister(stream.fd)
+            stream.registered = False
+
+    def _disconnect_source(self, stream):
+        self._want_write(stream, False)
+        for fd in [stream.fd, stream.data_fd]:
+            if fd is not None:
+                os.close(fd)
+        stream.fd = None
+        stream.data_fd = None
+        stream.buffers = []
+        stream.splice = None
+        stream.source.connected = False
+
+    def _close_source(self, stream):
+        if stream.closed:
+            return
+        self._disconnect_source(stream)
+        stream.closed = True
+        stream.source.finish()
+        if self._verbose_level > 2:
+            print_action("Ended: pipebench memory source",
+                         ["Ended: {}".format(time.time()),
+                          "Frames Written: {}".format(stream.count)])
+
+    def _open_source(self, stream):
+        source = stream.source
+        try:
+            stream.fd = os.open(source._sink_path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as error:
+            if error.errno == errno.ENXIO:
+                return False
+            print("Can't open {}: {}".format(source._sink_path, error))
+            self._close_source(stream)
+            return True
+        if source._pipe_size:
+            set_pipe_size(stream.fd, source._pipe_size)
+        if source._frame_interval == 0 and source._feed_mode == "splice":
+            stream.data_fd = os.open(source._frames.data_path, os.O_RDONLY)
+        stream.count = 0
+        stream.due = time.monotonic()
+        source._start_pacing()
+        source.connected = True
+        self._sources.append(stream)
+        self._feed(stream)
+        return True
+
+    def _next_write(self, stream):
+        source = stream.source
+        frames = source._frames
+        if source._frame_interval == 0 and source._feed_mode != "frame":
+            start, end = source._next_batch(stream.count)
+            if stream.data_fd is not None:
+                offset = frames.index[start][0]
+                last_offset, last_size = frames.index[end-1]
+                stream.splice = [offset, last_offset + last_size - offset]
+            else:
+                stream.buffers = [frames[index] for index in range(start, end)]
+            stream.pending_frames = end - start
+        else:
+            stream.buffers = [frames[stream.count % len(frames)]]
+            stream.pending_frames = 1
+
+    def _write(self, stream):
+        if stream.splice:
+            written = os.splice(stream.data_fd,
+                                stream.fd,
+                                stream.splice[1],
+                                offset_src=stream.splice[0],
+                                flags=os.SPLICE_F_NONBLOCK)
+            if not written:
+                raise BrokenPipeError("Input ended while splicing")
+            stream.splice[0] += written
+            stream.splice[1] -= written
+            if not stream.splice[1]:
+                stream.splice = None
+            return
+        written = os.writev(stream.fd, stream.buffers)
+        while stream.buffers and written >= len(stream.buffers[0]):
+            written -= len(stream.buffers[0])
+            stream.buffers.pop(0)
+        if stream.buffers and written:
+            stream.buffers[0] = stream.buffers[0][written:]
+
+    def _feed(self, stream):
+        source = stream.source
+        for _ in range(MAX_WRITES_PER_EVENT):
+            if source._stopped:
+                self._close_source(stream)
+                return
+            if not stream.buffers and not stream.splice:
+                if time.monotonic() < stream.due:
+                    self._want_write(stream, False)
+                    self._schedule(stream)
+                    return
+                self._next_write(stream)
+            try:
+                self._write(stream)
+            except BlockingIOError:
+                self._want_write(stream, True)
+                return
+            except BrokenPipeError:
+                self._disconnect_source(stream)
+                self._sources.remove(stream)
+                self._opening.append(stream)
+                return
+            if not stream.buffers and not stream.splice:
+                stream.count += stream.pending_frames
+                source._frames_sent(stream.pending_frames)
+                if source._frame_interval:
+                    stream.due = source._schedule_next()
+                if (source._frame_count != -1) and (stream.count >= source._frame_count):
+                    source._stopped = True
+        self._want_write(stream, True)
+
+    def _open_sink(self, sink):
+        if sink._semaphore and not sink._semaphore.acquire(blocking=False):
+            return False
+        try:
+            fd = os.open(sink._source_path, os.O_RDONLY | os.O_NONBLOCK)
+        except OSError as error:
+            print("Can't open {}: {}".format(sink._source_path, error))
+            sink.finish()
+            return True
+        self._selector.register(fd, selectors.EVENT_READ, sink)
+        self._sinks[fd] = sink
+        sink.connected = True
+        return True
+
+    def _close_sink(self, fd):
+        sink = self._sinks.pop(fd)
+        self._selector.unregister(fd)
+        os.close(fd)
+        sink.finish()
+        if self._verbose_level > 2:
+            print_action("Ended: pipebench memory sink",
+                         ["Ended: {}".format(time.time()),
+                          "URI: {}".format(sink._source_uri),
+                          "Frames Read: {}".format(sink._frame_count)])
+
+    def _read(self, fd):
+        sink = self._sinks[fd]
+        if sink._stopped:
+            self._close_sink(fd)
+            return
+        try:
+            data = os.read(fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        if not data:
+            self._close_sink(fd)
+            return
+        sink.consume(data)
+
+    def _admit(self):
+        with self._lock:
+            self._opening.extend(self._new_sources)
+            self._waiting_sinks.extend(self._new_sinks)
+            self._new_sources = []
+            self._new_sinks = []
+
+        waiting_sinks = []
+        for sink in self._waiting_sinks:
+            if sink._stopped:
+                sink.finish()
+            elif not self._open_sink(sink):
+                waiting_sinks.append(sink)
+        self._waiting_sinks = waiting_sinks
+
+        opening, self._opening = self._opening, []
+        for stream in opening:
+            if stream.source._stopped:
+                self._close_source(stream)
+            elif not self._open_source(stream):
+                self._opening.append(stream)
+
+    def _reap(self):
+        for fd in [fd for fd, sink in self._sinks.items() if sink._stopped]:
+            self._close_sink(fd)
+        for stream in [stream for stream in self._sources if stream.source._stopped]:
+            self._sources.remove(stream)
+            self._close_source(stream)
+
+    def _run_timers(self):
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, stream = heapq.heappop(self._timers)
+            if not stream.closed and stream.fd is not None and not stream.registered:
+                self._feed(stream)
+
+    def _timeout(self):
+        timeout = self._poll_interval
+        if self._timers:
+            timeout = min(timeout, max(self._timers[0][0] - time.monotonic(), 0))
+        return timeout
+
+    def run(self):
+        if self._verbose_level > 0:
+            print_action("Starting: pipebench io engine",
+                         ["Started: {}".format(time.time()),
+                          "Selector: {}".format(type(self._selector).__name__)])
+        try:
+            while not self._stopped:
+                self._admit()
+                if not self._selector.get_map():
+                    time.sleep(self._timeout())
+                else:
+                    for key, mask in self._selector.select(self._timeout()):
+                        if isinstance(key.data, _SourceStream):
+                            if not key.data.closed:
+                                self._feed(key.data)
+                        elif key.fd in self._sinks:
+                            self._read(key.fd)
+                self._run_timers()
+                self._reap()
+        finally:
+            for stream in self._sources + self._opening:
+                self._close_source(stream)
+            for fd in list(self._sinks):
+                self._close_sink(fd)
+            for sink in self._waiting_sinks + self._new_sinks:
+                sink.finish()
+            for stream in self._new_sources:
+                stream.source.finish()
+            self._selector.close()
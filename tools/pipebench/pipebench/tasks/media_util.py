@@ -10,17 +10,26 @@ import urllib
 import os
 import json
 from collections import namedtuple
+from collections import deque
 from pipebench.schema.documents import rgetattr
 from pipebench.tasks.frame_info import FrameInfo
+from pipebench.tasks.annexb import scan_access_units
 import pipebench.tasks as tasks
+from pipebench.latency import LatencyHistogram
 from threading import Thread
 from threading import Lock
+from threading import Event
 import time
 from pipebench.util import print_action
 import sys
 import ffmpeg
 import math
 import tempfile
+import mmap
+import fcntl
+import numpy
+from fractions import Fraction
+from array import array
 
 FRAME_INFO_MODULE = os.path.abspath(tasks.frame_info.__file__)
 
@@ -36,6 +45,17 @@ MediaType = namedtuple("MediaType", ["source",
 
 FpsReport = namedtuple("FpsReport",["fps","min","max","sample_avg","avg","start","end"])
 
+FRAME_STORE_INDEX = "frame_store.index.json"
+FRAME_STORE_DATA = "frame_store.data"
+
+FEED_MODES = ["frame", "writev", "splice"]
+
+READ_SIZE = 256 * 1024
+
+PACING_POLICIES = ["catch-up", "drop"]
+
+F_SETPIPE_SZ = getattr(fcntl, "F_SETPIPE_SZ", 1031)
+
 
 MEDIA_TYPES = {
     "video/x-h264":MediaType("urisourcebin uri={}",
@@ -85,6 +105,14 @@ MEDIA_TYPES = {
                             ["raw.bin"])             
 }
 
+# ffmpeg muxer and annex-b bitstream filter of each encoded media type
+FFMPEG_FORMATS = {
+    "video/x-h264":("h264", "h264_mp4toannexb"),
+    "video/x-h265":("hevc", "hevc_mp4toannexb")
+}
+
+WORKLOAD_SYNTHESIS = ["multi-pass", "single-pass"]
+
 INFERENCE_ELEMENTS = {
     "detect":"gvadetect",
     "classify":"gvaclassify",
@@ -149,6 +177,33 @@ def gst_launch(elements,vaapi=True):
                             stderr=subprocess.DEVNULL)
     return result.returncode == 0
 
+def _model_precision(model, precision, verbose=True):
+    if (not hasattr(model, precision)):
+        default_precision = list(model.__dict__.keys())[0]
+        if verbose:
+            print("\nNo {} Model found, trying: {}\n".format(precision, default_precision))
+        precision = default_precision
+    return precision
+
+def _model_proc(model, precision):
+    model_proc = rgetattr(model,"{}.proc".format(precision),None)
+    if (not model_proc):
+        model_proc = getattr(model,"proc",None)
+    return model_proc
+
+def inference_model_files(models, inference_type, precision="FP32"):
+    result = []
+    for model in getattr(models,inference_type,[]):
+        if isinstance(model,str) and (model == 'full_frame'):
+            result.append(model)
+            continue
+        precision = _model_precision(model, precision, verbose=False)
+        result.append({"precision":precision,
+                       "xml":rgetattr(model,"{}.xml".format(precision)),
+                       "bin":rgetattr(model,"{}.bin".format(precision),None),
+                       "proc":_model_proc(model, precision)})
+    return result
+
 def _create_inference_elements(models, inference_type, precision="FP32", properties={}):
     result = []
     
@@ -162,18 +217,12 @@ def _create_inference_elements(models, inference_type, precision="FP32", propert
             continue
         
         model_element = []        
-        if (not hasattr(model, precision)):
-            default_precision = list(model.__dict__.keys())[0]
-            print("\nNo {} Model found, trying: {}\n".format(precision, default_precision))
-            precision = default_precision
+        precision = _model_precision(model, precision)
         
         model_element.append("{} model={}".format(element,
                                                   rgetattr(model,"{}.xml".format(precision))))
 
-        model_proc = rgetattr(model,"{}.proc".format(precision),None)
-
-        if (not model_proc):
-            model_proc = getattr(model,"proc",None)
+        model_proc = _model_proc(model, precision)
 
         if (model_proc):
             model_element.append("model-proc={}".format(model_proc))
@@ -200,10 +249,25 @@ def create_reference(source_dir,
     caps = caps_info["caps"]
     original_media_source = caps_info["source"]
     source_media_type = MEDIA_TYPES[caps.split(',')[0]]
-    if (individual_frames):
+
+    # Frame files are removed once packed into the frame store, the
+    # frames of the store are read back to back from its data file
+    frame_files = individual_frames and list_frame_paths(source_dir,
+                                                         source_media_type.frame_extension)
+    frame_store_index = read_frame_store_index(source_dir) if individual_frames else None
+    if (frame_files):
         source = "multifilesrc location={}/frame_%06d.{} caps=\"{}\"".format(source_dir,
                                                                              source_media_type.frame_extension,
         caps)
+    elif (frame_store_index):
+        blocksize = ""
+        if (not source_media_type.parse) and frame_store_index["frames"]:
+            # Raw frames have a fixed size
+            blocksize = " blocksize={}".format(frame_store_index["frames"][0][1])
+        source = "filesrc location={}/{}{} ! \"{}\"".format(source_dir,
+                                                            frame_store_index["data"],
+                                                            blocksize,
+                                                            caps)
     else:
         source = "filesrc location={}/stream.{} ! \"{}\"".format(source_dir,
                                                                  source_media_type.elementary_stream_extensions[0],
@@ -211,7 +275,7 @@ def create_reference(source_dir,
 
     if "PIPELINE_ZOO_PLATFORM" in os.environ and os.environ["PIPELINE_ZOO_PLATFORM"]=="VCAC_A":
         decode = "avdec_h264 "
-    elif individual_frames:
+    elif frame_files:
         decode = "decodebin sink-caps=\"{}\"".format(caps)
     else:
         decode = "decodebin"
@@ -361,16 +425,83 @@ def _concat_stream(input_media, frame_count, target_frame_count, target_dir):
     else:
         return None
 
+def _encoded_caps(media_type, input_media, target_fps):
+    probe_info = ffmpeg.probe(input_media, select_streams="v:0")['streams'][0]
+    frame_rate = Fraction(target_fps).limit_denominator(1001)
+    return "{},width={},height={},framerate={}/{}".format(media_type.encoded_caps,
+                                                         probe_info["width"],
+                                                         probe_info["height"],
+                                                         frame_rate.numerator,
+                                                         frame_rate.denominator)
+
+def index_elementary_stream(input_directory, data, media_type):
+    offsets, sizes = scan_access_units(os.path.join(input_directory, data), media_type)
+    index = {"data": data,
+             "frames": numpy.stack([offsets, sizes], axis=1).tolist()}
+    _write_frame_store_index(input_directory, index)
+    return index
+
+def _synthesize_stream(target_dir, media_type_key, media,
+                       individual_frames, copies, frame_rate, target_fps):
+    # The memory source frame store indexes the elementary stream in place
+    media_type = MEDIA_TYPES[media_type_key]
+    muxer, bitstream_filter = FFMPEG_FORMATS[media_type_key]
+    stream_name = "stream.{}".format(media_type.elementary_stream_extensions[0])
+    stream_path = os.path.join(target_dir, stream_name)
+    copy_args = ["-map", "0:v:0", "-c:v", "copy"]
+
+    command_args = ["ffmpeg",
+                    "-nostdin",
+                    "-y",
+                    "-stream_loop", str(copies - 1),
+                    "-i", media]
+    command_args.extend(copy_args + ["-bsf:v", bitstream_filter, "-f", muxer, stream_path])
+
+    if (not individual_frames) and (frame_rate != target_fps):
+        # Rescales timestamps, equivalent to remuxing the stream with -r target_fps
+        scale = frame_rate / target_fps
+        command_args.extend(copy_args + ["-bsf:v", "setts=pts=PTS*{0}:dts=DTS*{0}".format(scale),
+                                         os.path.join(target_dir,
+                                                      "stream.fps.{}".format(media_type.container_formats[0]))])
+
+    result = subprocess.run(command_args,
+                            check=False,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    if result.returncode != 0:
+        return False
+
+    if individual_frames:
+        index_elementary_stream(target_dir, stream_name, media_type_key)
+
+    media_uri = urllib.parse.urlunsplit(["file",None,media,None,None])
+    with open(os.path.join(target_dir, "caps.json"), "w") as caps_file:
+        json.dump({"caps": _encoded_caps(media_type, media, target_fps),
+                   "source": media_uri},
+                  caps_file)
+    return True
+
 def create_encoded_stream(target_dir, media_type, media,
                           individual_frames=True,
                           duration=60,
-                          target_fps=30):
+                          target_fps=30,
+                          synthesis="multi-pass"):
 
     if (media_type not in MEDIA_TYPES):
         raise Exception("Unsupported Media Type: {}".format(media_type))
 
+    if (synthesis not in WORKLOAD_SYNTHESIS):
+        raise Exception("Unsupported workload synthesis: {}".format(synthesis))
+
+    if (synthesis == "single-pass") and (media_type not in FFMPEG_FORMATS):
+        print("Single pass synthesis not supported for {}, using multi-pass".format(media_type))
+        synthesis = "multi-pass"
+
+    media_type_key = media_type
     media_type = MEDIA_TYPES[media_type]
     media_uri = None
+    start_time = time.time()
+    passes = 1
     if (os.path.isfile(media)):
 
         frame_count, frame_rate = _stream_info(media)
@@ -378,21 +509,45 @@ def create_encoded_stream(target_dir, media_type, media,
         if target_fps == 0:
             target_fps = frame_rate
 
+        copies = 1
         if duration == 0:
             duration = frame_count / target_fps
         else:
             target_frame_count = (duration * target_fps * 2)
             if frame_count < target_frame_count:
-                media = _concat_stream(media,
-                                       frame_count,
-                                       target_frame_count,
-                                       target_dir)
-            
+                copies = math.ceil(target_frame_count/frame_count)
+
+        if synthesis == "single-pass":
+            success = _synthesize_stream(target_dir,
+                                         media_type_key,
+                                         media,
+                                         individual_frames,
+                                         copies,
+                                         frame_rate,
+                                         target_fps)
+            print_action("Workload Synthesis",
+                         ["Method: single-pass",
+                          "Passes: 1",
+                          "Time: {:.2f}s".format(time.time() - start_time)])
+            return success, duration, target_fps
+
+        if copies > 1:
+            media = _concat_stream(media,
+                                   frame_count,
+                                   target_frame_count,
+                                   target_dir)
+            passes += 1
+
         if frame_rate != target_fps:
             media = _convert_frame_rate(media,
                                         media_type,
                                         target_fps,
                                         target_dir)
+            passes += 2
+
+        if individual_frames:
+            # Packing frame files into the frame store
+            passes += 1
         media_uri = urllib.parse.urlunsplit(["file",None,media,None,None])
     else:
         raise Exception("Media is not a file: {}".format(media))
@@ -412,8 +567,154 @@ def create_encoded_stream(target_dir, media_type, media,
     else:
         sink = "filesink location={}/stream.{}".format(target_dir,media_type.elementary_stream_extensions[0])
 
-    return gst_launch([source,demux,parse,encoded_caps,frame_info,sink],vaapi=False), duration, target_fps
+    success = gst_launch([source,demux,parse,encoded_caps,frame_info,sink],vaapi=False)
+    print_action("Workload Synthesis",
+                 ["Method: multi-pass",
+                  "Passes: {}".format(passes),
+                  "Time: {:.2f}s".format(time.time() - start_time)])
+    return success, duration, target_fps
+
+
+
+def _frame_number(frame_path):
+    return int(os.path.basename(frame_path).split('_')[1].split('.')[0])
+
+def list_frame_paths(input_directory, frame_extension):
+    frame_paths = [ os.path.join(input_directory, path)
+                    for path in os.listdir(input_directory)
+                    if path.endswith(frame_extension) ]
+    frame_paths = [ frame_path for frame_path in frame_paths if os.path.isfile(frame_path) ]
+    frame_paths.sort(key=_frame_number)
+    return frame_paths
 
+def read_frame_store_index(input_directory):
+    index_path = os.path.join(input_directory, FRAME_STORE_INDEX)
+    if not os.path.isfile(index_path):
+        return None
+    with open(index_path, "r") as index_file:
+        return json.load(index_file)
+
+def create_frame_store(input_directory, frame_extension):
+
+    frame_paths = list_frame_paths(input_directory, frame_extension)
+
+    index = read_frame_store_index(input_directory)
+
+    # Frame files are removed once packed, single pass workloads never write them
+    if index and not frame_paths:
+        return index
+
+    if index and len(index["frames"]) == len(frame_paths):
+        _remove_frame_files(input_directory, index, frame_paths)
+        return index
+
+    data_path = os.path.join(input_directory, FRAME_STORE_DATA)
+
+    frames = []
+    offset = 0
+    with open(data_path + ".temp", "wb") as data_file:
+        for frame_path in frame_paths:
+            with open(frame_path, "rb") as frame_file:
+                frame = frame_file.read()
+            data_file.write(frame)
+            frames.append([offset, len(frame)])
+            offset += len(frame)
+
+    index = {"data": FRAME_STORE_DATA,
+             "frames": frames}
+
+    os.replace(data_path + ".temp", data_path)
+    _write_frame_store_index(input_directory, index)
+    _remove_frame_files(input_directory, index, frame_paths)
+
+    return index
+
+def _remove_frame_files(input_directory, index, frame_paths):
+    sizes = [size for _, size in index["frames"]]
+    data_path = os.path.join(input_directory, index["data"])
+    if ((len(sizes) != len(frame_paths)) or
+        (os.path.getsize(data_path) != sum(sizes)) or
+        any([os.path.getsize(frame_path) != size for frame_path, size in zip(frame_paths, sizes)])):
+        print("Frame store does not match frame files in {}".format(input_directory))
+        return
+    for frame_path in frame_paths:
+        os.remove(frame_path)
+
+def _write_frame_store_index(input_directory, index):
+    index_path = os.path.join(input_directory, FRAME_STORE_INDEX)
+    with open(index_path + ".temp", "w") as index_file:
+        json.dump(index, index_file)
+    os.replace(index_path + ".temp", index_path)
+
+def truncate_frame_store(input_directory, frame_count):
+    index = read_frame_store_index(input_directory)
+    if index and len(index["frames"]) > frame_count:
+        index["frames"] = index["frames"][:frame_count]
+        _write_frame_store_index(input_directory, index)
+    return index
+
+
+# Frames are slices of one memory map, sources of a workload share the page cache
+class FrameStore(object):
+
+    def __init__(self, input_directory):
+        index = read_frame_store_index(input_directory)
+        if not index:
+            raise Exception("Frame store not found in: {}".format(input_directory))
+        self._data_path = os.path.join(input_directory, index["data"])
+        self._index = [ (offset, size) for offset, size in index["frames"] ]
+        self._mmap = None
+        self._view = memoryview(b"")
+        self._frames = []
+        if os.path.getsize(self._data_path):
+            with open(self._data_path, "rb") as data_file:
+                self._mmap = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mmap)
+            self._frames = [ self._view[offset:offset+size] for offset, size in self._index ]
+
+    @property
+    def data_path(self):
+        return self._data_path
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def view(self):
+        return self._view
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __getitem__(self, frame_index):
+        return self._frames[frame_index]
+
+
+def _write_all(fd, buffers):
+    buffers = list(buffers)
+    while buffers:
+        written = os.writev(fd, buffers)
+        while buffers and written >= len(buffers[0]):
+            written -= len(buffers[0])
+            buffers.pop(0)
+        if buffers and written:
+            buffers[0] = buffers[0][written:]
+
+def _splice_all(source_fd, fd, offset, length):
+    while length:
+        written = os.splice(source_fd, fd, length, offset_src=offset)
+        if not written:
+            raise BrokenPipeError("Input ended while splicing")
+        offset += written
+        length -= written
+
+def set_pipe_size(fd, pipe_size):
+    try:
+        return fcntl.fcntl(fd, F_SETPIPE_SZ, pipe_size)
+    except OSError as error:
+        print("Can't set pipe size to {}: {}".format(pipe_size, error))
+    return None
 
 
 class MediaSink(Thread):
@@ -440,39 +741,44 @@ class MediaSink(Thread):
                  output_dir = None,
                  semaphore = None,
                  verbose_level = 0,
+                 engine = None,
+                 frame_latency = False,
+                 counters = None,
+                 fps_series = False,
                  *args,
                  **kwargs):
         self._semaphore = semaphore
+        self._counters = counters
+        self._fps_series = fps_series
+        self._frame_times = deque() if frame_latency else None
+        self._engine = engine
+        self._finished = Event()
+        self._engine_started = False
+        self._frame_bytes = 0
+        self._frame_buffer = bytearray()
         self._reference_directory = reference_directory
         self._source_path = source_path
         self._warm_up = warm_up
         self._frame_count = 0
-        self._start_time = None
-        self._end_time = None
         self._media_type = MEDIA_TYPES[caps.split(',')[0]]
-        self._min_sample_fps =  sys.maxsize
-        self._max_sample_fps = 0
-        self._last_sample_fps = 0
-        self._total_sample_fps = 0
-        self._avg_fps = 0
-        self._avg_sample_fps = 0
         self._sample_size = sample_size
-        self._sample_count = 0
+        self._accounting_lock = Lock()
+        self._reset_accounting()
         self._source_uri = source_uri
         self.connected = False
         self._stopped = False
         self._save_pipeline_output = save_pipeline_output
         self._output_file = None
         self._output_dir = output_dir
+        self._output_lock = Lock()
         self._stream_index = stream_index
         self._verbose_level = verbose_level
-        if (self._media_type.encoded_caps) and ("jsonl" in self._media_type.encoded_caps):
+        self._lines = (self._media_type.encoded_caps) and ("jsonl" in self._media_type.encoded_caps)
+        if self._lines:
             self._frame_sizes = None
             self.run = self.read_lines
             if self._save_pipeline_output:
-                self._output_file = open(os.path.join(output_dir,
-                                                      "stream_{}.objects.jsonl".format(stream_index)),
-                                         "wb")
+                self._output_file = self._open_output_file()
         else:
             self._frame_sizes = self._load_frame_sizes()
             self.run = self.read_frames
@@ -489,8 +795,190 @@ class MediaSink(Thread):
                          self._start_time,
                          self._end_time)
 
+    def get_sample_error(self):
+        samples = self._sample_count - self._warm_up if self._start_time else 0
+        if (samples < 2):
+            return samples, None
+        variance = max(self._sample_fps_m2, 0) / (samples - 1)
+        return samples, math.sqrt(variance / samples)
+
+    @property
+    def frame_times(self):
+        return self._frame_times
+
+    def get_fps_series(self):
+        if not self._fps_series:
+            return None
+        with self._accounting_lock:
+            return array('d', self._sample_times), array('q', self._sample_frames)
+
+    def get_frame_latency(self):
+        if self._frame_times is None:
+            return {}
+        return {"frame_latency": self._frame_latency.summary()}
+
     def stop(self):
         self._stopped = True
+
+    def _reset_accounting(self):
+        self._start_time = None
+        self._end_time = None
+        self._min_sample_fps =  sys.maxsize
+        self._max_sample_fps = 0
+        self._last_sample_fps = 0
+        self._total_sample_fps = 0
+        self._avg_fps = 0
+        self._avg_sample_fps = 0
+        self._sample_fps_m2 = 0
+        self._sample_count = 0
+        self._frame_latency = LatencyHistogram()
+        self._sample_times = array('d')
+        self._sample_frames = array('q')
+        self._publish()
+
+    def _publish(self):
+        if self._counters is not None:
+            self._counters[:] = (self._frame_count,
+                                 self._last_sample_fps,
+                                 self._min_sample_fps,
+                                 self._max_sample_fps,
+                                 self._avg_sample_fps,
+                                 self._avg_fps,
+                                 self._start_time or math.nan,
+                                 self._end_time or math.nan)
+
+    def _open_output_file(self):
+        return open(os.path.join(self._output_dir,
+                                 "stream_{}.objects.jsonl".format(self._stream_index)),
+                    "wb")
+
+    def reset(self, output_dir=None):
+        # Saved pipeline output continues in output_dir if given
+        with self._accounting_lock:
+            self._reset_accounting()
+        if output_dir:
+            with self._output_lock:
+                self._output_dir = output_dir
+                if self._output_file:
+                    previous_output_file = self._output_file
+                    self._output_file = self._open_output_file()
+                    previous_output_file.close()
+
+    def start(self):
+        if self._engine:
+            self._engine_started = True
+            self._engine.add_sink(self)
+        else:
+            super().start()
+
+    def is_alive(self):
+        if self._engine:
+            return self._engine_started and not self._finished.is_set()
+        return super().is_alive()
+
+    def join(self, timeout=None):
+        if self._engine:
+            self._finished.wait(timeout)
+        else:
+            super().join(timeout)
+
+    def _frame_received(self, count=1):
+        with self._accounting_lock:
+            if self._frame_times is not None:
+                self._update_frame_latency(count)
+            self._update_fps(count)
+
+    def _update_frame_latency(self, count):
+        # Output frames are paired with input frames in order
+        current_time = time.monotonic()
+        for _ in range(min(count, len(self._frame_times))):
+            write_time = self._frame_times.popleft()
+            if (self._start_time):
+                self._frame_latency.add((current_time - write_time) * 1000)
+
+    def _update_fps(self, count):
+        previous_count = self._frame_count
+        self._frame_count = self._frame_count + count
+
+        samples = (self._frame_count // self._sample_size) - (previous_count // self._sample_size)
+
+        if (samples):
+            self._sample_count += samples
+            current_time = time.time()
+            if (self._fps_series):
+                # Includes warm up samples so that ramp up is visible
+                self._sample_times.append(current_time)
+                self._sample_frames.append(self._frame_count)
+            if (self._sample_count >= self._warm_up):
+                if (not self._start_time):
+                    self._start_time = current_time
+                    self._last_start_time = current_time
+                    self._start_frame_count = self._frame_count
+                    self._last_start_frame_count = self._frame_count
+                    self._sample_count = self._warm_up
+                    return
+                if (current_time <= self._last_start_time):
+                    return
+                self._last_sample_fps = ((self._frame_count - self._last_start_frame_count) /
+                                         (current_time - self._last_start_time))
+                if (self._last_sample_fps > self._max_sample_fps):
+                    self._max_sample_fps = self._last_sample_fps
+                if (self._last_sample_fps < self._min_sample_fps):
+                    self._min_sample_fps = self._last_sample_fps
+                previous_avg_sample_fps = self._avg_sample_fps
+                self._total_sample_fps += self._last_sample_fps * samples
+                self._avg_sample_fps = self._total_sample_fps / (self._sample_count-self._warm_up)
+                # Welford update of the sample fps variance
+                self._sample_fps_m2 += (samples *
+                                        (self._last_sample_fps - previous_avg_sample_fps) *
+                                        (self._last_sample_fps - self._avg_sample_fps))
+                self._last_start_time = current_time
+                self._last_start_frame_count = self._frame_count
+                self._avg_fps = (self._frame_count - self._start_frame_count) / (current_time - self._start_time)
+                self._publish()
+
+    def _write_frame_output(self, frame):
+        with self._output_lock, open(os.path.join(self._output_dir,
+                               "stream_{}.frame_{:06d}.raw.bin".format(self._stream_index,
+                                                                       self._frame_count)),
+                  "wb") as output:
+            output.write(frame)
+
+    def consume(self, data):
+        if self._lines:
+            if self._save_pipeline_output:
+                with self._output_lock:
+                    self._output_file.write(data)
+            lines = data.count(b'\n')
+            if lines:
+                self._frame_received(lines)
+            return
+
+        input_len = len(self._frame_sizes)
+        offset = 0
+        while offset < len(data):
+            frame_size = self._frame_sizes[self._frame_count % input_len]
+            needed = frame_size - self._frame_bytes
+            chunk = data[offset:offset+needed]
+            offset += len(chunk)
+            self._frame_bytes += len(chunk)
+            if self._save_pipeline_output:
+                self._frame_buffer.extend(chunk)
+            if self._frame_bytes == frame_size:
+                self._frame_bytes = 0
+                self._frame_received()
+                if self._save_pipeline_output:
+                    self._write_frame_output(self._frame_buffer)
+                    self._frame_buffer.clear()
+
+    def finish(self):
+        self.connected = False
+        if not self._end_time:
+            self._end_time = time.time()
+            self._publish()
+        if self._output_file:
+            self._output_file.close()
+        self._finished.set()
         
     def read_lines(self):
 
@@ -503,47 +991,20 @@ class MediaSink(Thread):
                              ["Started: {}".format(time.time()),
                               "URI: {}".format(self._source_uri)])
 
-            with open(self._source_path,"rb") as source_fifo:
+            with open(self._source_path,"rb", buffering=0) as source_fifo:
                 self.connected = True
-                next_char = ""
-                line = bytearray()
-                while next_char != None:
-                    line.clear()
-                    next_char = ""
-                    while(next_char != b'\n'):
-                        next_char = None if self._stopped else source_fifo.read(1)
-                        if (not next_char):
-                            self._end_time = time.time()
-                            break
-                        line.extend(next_char)
-                    if (not next_char):
+                while (not self._stopped):
+                    data = source_fifo.read(READ_SIZE)
+                    if (not data):
+                        self._end_time = time.time()
+                        self._publish()
                         break
-                    if self._save_pipeline_output:
-                        self._output_file.write(line)
-                    self._frame_count = self._frame_count + 1
-
-                    if (self._frame_count % self._sample_size == 0):
-                        self._sample_count += 1
-                        if (self._sample_count >= self._warm_up):
-                            current_time = time.time()
-                            if (not self._start_time):
-                                self._start_time = current_time
-                                self._last_start_time = current_time
-                                self._start_frame_count = self._frame_count
-                                continue
-                            self._last_sample_fps = self._sample_size / (current_time - self._last_start_time)
-                            if (self._last_sample_fps > self._max_sample_fps):
-                                self._max_sample_fps = self._last_sample_fps
-                            if (self._last_sample_fps < self._min_sample_fps):
-                                self._min_sample_fps = self._last_sample_fps
-                            self._total_sample_fps += self._last_sample_fps
-                            self._avg_sample_fps = self._total_sample_fps / (self._sample_count-self._warm_up)
-                            self._last_start_time = current_time
-                            self._avg_fps = (self._frame_count - self._start_frame_count) / (current_time - self._start_time)
+                    self.consume(data)
 
             self.connected = False
             if not self._end_time:
                 self._end_time = time.time()
+                self._publish()
             if self._verbose_level > 2:
                 print_action("Ended: pipebench memory sink",
                              ["Ended: {}".format(time.time()),
@@ -585,41 +1046,20 @@ class MediaSink(Thread):
                             bytes_read = bytes_read + len(bytes_)
                         if (not bytes_read):
                             self._end_time = time.time()
+                            self._publish()
                             break
 
                     if (bytes_read):
 
-                        self._frame_count += 1
+                        self._frame_received()
 
                         if self._save_pipeline_output:
-                            with open(os.path.join(self._output_dir,
-                                                   "stream_{}.frame_{:06d}.raw.bin".format(self._stream_index,
-                                                                                           self._frame_count)),
-                                      "wb") as output:
-                                output.write(frame)
-
-                        if (self._frame_count % self._sample_size == 0):
-                            self._sample_count += 1
-                            if (self._sample_count >= self._warm_up):
-                                current_time = time.time()
-                                if (not self._start_time):
-                                    self._start_time = current_time
-                                    self._last_start_time = current_time
-                                    self._start_frame_count = self._frame_count
-                                    continue
-                                self._last_sample_fps = self._sample_size / (current_time - self._last_start_time)
-                                if (self._last_sample_fps > self._max_sample_fps):
-                                    self._max_sample_fps = self._last_sample_fps
-                                if (self._last_sample_fps < self._min_sample_fps):
-                                    self._min_sample_fps = self._last_sample_fps
-                                self._total_sample_fps += self._last_sample_fps
-                                self._avg_sample_fps = self._total_sample_fps / (self._sample_count-self._warm_up)
-                                self._last_start_time = current_time
-                                self._avg_fps = (self._frame_count - self._start_frame_count) / (current_time - self._start_time)
+                            self._write_frame_output(frame)
 
             self.connected = False
             if not self._end_time:
                 self._end_time = time.time()
+                self._publish()
             print_action("Ended: pipebench memory sink",
                          ["Ended: {}".format(time.time()),
                           "URI: {}".format(self._source_uri),
@@ -634,10 +1074,6 @@ class MediaSource(Thread):
     _frame_cache = {}
     _frame_cache_lock = Lock()
 
-    def _read_file(self,path):
-        with open(path,"rb") as input:
-            return input.read()
-
     def _read_input(self):
 
         cache_key = (self._input_directory,self._media_type.frame_extension)
@@ -649,16 +1085,12 @@ class MediaSource(Thread):
             frames = MediaSource._frame_cache.get(cache_key, None)
 
             if not frames:
-                
-                frame_paths = [ os.path.join(self._input_directory, path)
-                                for path in os.listdir(self._input_directory)
-                                if path.endswith(self._media_type.frame_extension) ]
-            
-                frame_paths = [ frame_path for frame_path in frame_paths if os.path.isfile(frame_path) ]
-                
-                frame_paths.sort(key= lambda item: int(os.path.basename(item).split('_')[1].split('.')[0]))
 
-                MediaSource._frame_cache[cache_key] = [self._read_file(frame_path) for frame_path in frame_paths]
+                if not read_frame_store_index(self._input_directory):
+                    create_frame_store(self._input_directory,
+                                       self._media_type.frame_extension)
+
+                MediaSource._frame_cache[cache_key] = FrameStore(self._input_directory)
                 
                 frames = MediaSource._frame_cache[cache_key]
         
@@ -673,6 +1105,12 @@ class MediaSource(Thread):
                  frame_rate=-1,
                  frame_count = -1,
                  elapsed_time=-1,
+                 feed_mode = "frame",
+                 batch_size = 32,
+                 pipe_size = 0,
+                 engine = None,
+                 pacing_policy = "catch-up",
+                 frame_times = None,
                  *args, **kwargs):
 
         self._media_type = MEDIA_TYPES[caps.split(',')[0]]
@@ -684,14 +1122,38 @@ class MediaSource(Thread):
         self._frame_count = frame_count
         self.connected = False
         self._stopped = False
+        self._batch_size = max(batch_size, 1)
+        self._pipe_size = pipe_size
+        self._engine = engine
+        self._finished = Event()
+        self._engine_started = False
+
+        if (feed_mode not in FEED_MODES):
+            raise Exception("Unsupported feed mode: {}".format(feed_mode))
+
+        if (feed_mode == "splice") and (not hasattr(os, "splice")):
+            print("os.splice not available, using writev")
+            feed_mode = "writev"
+
+        self._feed_mode = feed_mode
 
         if (self._frame_count == -1) and (elapsed_time != -1 ) and (self._frame_rate>-1):
             self._frame_count = elapsed_time * self._frame_rate
 
-        self._sleep_time = 0
+        if (pacing_policy not in PACING_POLICIES):
+            raise Exception("Unsupported pacing policy: {}".format(pacing_policy))
+
+        self._pacing_policy = pacing_policy
+        self._frame_times = frame_times
+        self._frame_interval = 0
+        self._deadline = None
+        self._dropped_slots = 0
+        self._frames_written = 0
+        self._first_write_time = None
+        self._last_write_time = None
 
-        if (self._frame_rate != -1 ):
-            self._sleep_time = 1 / (self._frame_rate + 0.5)
+        if (self._frame_rate > 0):
+            self._frame_interval = 1 / self._frame_rate
             
         super().__init__(*args, **kwargs)
 
@@ -700,6 +1162,85 @@ class MediaSource(Thread):
 
     def stop(self):
         self._stopped = True
+
+    def start(self):
+        if self._engine:
+            self._engine_started = True
+            self._engine.add_source(self)
+        else:
+            super().start()
+
+    def is_alive(self):
+        if self._engine:
+            return self._engine_started and not self._finished.is_set()
+        return super().is_alive()
+
+    def join(self, timeout=None):
+        if self._engine:
+            self._finished.wait(timeout)
+        else:
+            super().join(timeout)
+
+    def finish(self):
+        self.connected = False
+        self._finished.set()
+
+    def reset(self):
+        self._first_write_time = None
+        self._frames_written = 0
+        self._dropped_slots = 0
+
+    def _start_pacing(self):
+        self._deadline = time.monotonic()
+        if (self._frame_times is not None):
+            # Frames written to a previous reader never get an output
+            self._frame_times.clear()
+
+    def _schedule_next(self):
+        self._deadline += self._frame_interval
+        if (self._pacing_policy == "drop"):
+            late = time.monotonic() - self._deadline
+            if (late > self._frame_interval):
+                missed = math.floor(late / self._frame_interval)
+                self._deadline += missed * self._frame_interval
+                self._dropped_slots += missed
+        return self._deadline
+
+    def _frames_sent(self, count):
+        if (self._frame_times is not None):
+            self._frame_times.extend([time.monotonic()] * count)
+        current_time = time.time()
+        if (not self._first_write_time):
+            self._first_write_time = current_time
+        self._last_write_time = current_time
+        self._frames_written += count
+
+    def get_input_fps(self):
+        fps = 0
+        if (self._first_write_time) and (self._last_write_time > self._first_write_time):
+            fps = (self._frames_written - 1) / (self._last_write_time - self._first_write_time)
+        return {"input_fps": fps,
+                "dropped_slots": self._dropped_slots}
+
+    def _next_batch(self, count):
+        frame_len = len(self._frames)
+        start = count % frame_len
+        end = min(start + self._batch_size, frame_len)
+        if (self._frame_count != -1):
+            end = min(end, start + self._frame_count - count)
+        return start, end
+
+    def _write_batch(self, fd, data_fd, count):
+        start, end = self._next_batch(count)
+
+        if (data_fd is not None):
+            offset = self._frames.index[start][0]
+            last_offset, last_size = self._frames.index[end-1]
+            _splice_all(data_fd, fd, offset, last_offset + last_size - offset)
+        else:
+            _write_all(fd, [self._frames[index] for index in range(start, end)])
+
+        return count + (end - start)
     
     def run(self):
         
@@ -716,11 +1257,27 @@ class MediaSource(Thread):
             self.connected = False
             with open(self._sink_path,"wb", buffering=0) as sink_fifo:
                 self.connected = True
+                if (self._pipe_size):
+                    set_pipe_size(sink_fifo.fileno(), self._pipe_size)
+                batched = (self._frame_interval == 0) and (self._feed_mode != "frame")
+                data_fd = None
+                if batched and (self._feed_mode == "splice"):
+                    data_fd = os.open(self._frames.data_path, os.O_RDONLY)
+                self._start_pacing()
                 try:
                     while(not self._stopped):
-                        written = sink_fifo.write(self._frames[count % frame_len])
-                        time.sleep(self._sleep_time)
-                        count += 1
+                        if batched:
+                            previous_count = count
+                            count = self._write_batch(sink_fifo.fileno(), data_fd, count)
+                            self._frames_sent(count - previous_count)
+                        else:
+                            written = sink_fifo.write(self._frames[count % frame_len])
+                            count += 1
+                            self._frames_sent(1)
+                            if (self._frame_interval):
+                                delay = self._schedule_next() - time.monotonic()
+                                if (delay > 0):
+                                    time.sleep(delay)
                         if (self._frame_count!=-1) and (count>=self._frame_count):
                             self._stopped = True
                        
@@ -730,6 +1287,9 @@ class MediaSource(Thread):
                                   "Frames Written: {}".format(count+1)])
 
                     continue
+                finally:
+                    if (data_fd is not None):
+                        os.close(data_fd)
 
             break
 
@@ -4,6 +4,55 @@ from pipebench.schema.documents import validate
 import shlex
 import util
 import time
+import json
+import errno
+import shutil
+import tempfile
+import itertools
+
+def _runner_command(runner,
+                    runner_config,
+                    pipeline_root,
+                    systeminfo_path,
+                    numa_node = None):
+
+    runner_root = os.path.join(pipeline_root, "runners", runner)
+
+    default_run = os.path.join(runner_root, "run.sh")
+
+    if (runner_config and "run" in runner_config):
+        runner_command = shlex.split(runner_config["run"])
+    else:
+        runner_command = ["/bin/bash",default_run]
+
+    runner_command.extend(["--systeminfo={}".format(systeminfo_path)])
+
+    if numa_node is not None:
+        runner_command = ["numactl","--cpunodebind",str(numa_node),"--membind",str(numa_node)] + runner_command
+
+    return runner_command, runner_root
+
+def _runner_environment(runner_config,
+                        run_root,
+                        gpu_render_device = None):
+
+    environment = {}
+    render_device_verbose = []
+
+    # Do not set environment if already set by docker/run.sh
+    if gpu_render_device is not None and "GST_VAAPI_DRM_DEVICE" not in os.environ:
+        environment["GST_VAAPI_DRM_DEVICE"] = gpu_render_device
+        render_device_verbose = ["GST_VAAPI_DRM_DEVICE: {}".format(gpu_render_device)]
+        util.print_action("Setting GST_VAAPI_DRM_DEVICE to {}".format(gpu_render_device))
+
+    if "latency" in runner_config:
+        latency_log = os.path.join(
+            run_root, runner_config["latency"]["GST_DEBUG_FILE"])
+        util.print_action("Latency file {}\n".format(latency_log))
+        environment.update(runner_config["latency"])
+        environment["GST_DEBUG_FILE"] = latency_log
+
+    return environment, render_device_verbose
 
 def start_pipeline_runner(runner,
                           runner_config,
@@ -16,11 +65,6 @@ def start_pipeline_runner(runner,
                           gpu_render_device = None,
                           verbose_level=0):
 
-    runner_root = os.path.join(pipeline_root, "runners", runner)
-
-    default_run = os.path.join(runner_root, "run.sh")
-
-
     if (redirect):
         stdout_path = os.path.join(run_root, "stdout.txt")
 
@@ -33,32 +77,21 @@ def start_pipeline_runner(runner,
         stdout_file = None
         stderr_file = None
 
-    if (runner_config and "run" in runner_config):
-        runner_command = shlex.split(runner_config["run"])
-    else:
-        runner_command = ["/bin/bash",default_run]
-
-    runner_command.extend(["--systeminfo={}".format(systeminfo_path)])
+    runner_command, runner_root = _runner_command(runner,
+                                                  runner_config,
+                                                  pipeline_root,
+                                                  systeminfo_path,
+                                                  numa_node)
 
     runner_command.append(piperun_config_path)
-    if numa_node is not None:
-        runner_command = ["numactl","--cpunodebind",str(numa_node),"--membind",str(numa_node)] + runner_command
 
-    environment = None
-    render_device_verbose = []
-
-    # Do not set environment if already set by docker/run.sh
-    if gpu_render_device is not None and "GST_VAAPI_DRM_DEVICE" not in os.environ:
-        environment = dict(os.environ,GST_VAAPI_DRM_DEVICE=gpu_render_device)
-        render_device_verbose = ["GST_VAAPI_DRM_DEVICE: {}".format(gpu_render_device)]
-        util.print_action("Setting GST_VAAPI_DRM_DEVICE to {}".format(gpu_render_device))
-
-    if "latency" in runner_config:
-        latency_log = os.path.join(
-            run_root, runner_config["latency"]["GST_DEBUG_FILE"])
-        util.print_action("Latency file {}\n".format(latency_log))
-        runner_config["latency"].update({"GST_DEBUG_FILE": latency_log})
-        environment = dict(os.environ, **runner_config["latency"])
+    environment, render_device_verbose = _runner_environment(runner_config,
+                                                             run_root,
+                                                             gpu_render_device)
+    if environment:
+        environment = dict(os.environ, **environment)
+    else:
+        environment = None
 
     start_time = time.time()
     if verbose_level>0:
@@ -75,3 +108,133 @@ def start_pipeline_runner(runner,
                                env=environment)
     return process
 
+
+class RunnerWorker(object):
+
+    def __init__(self, process, control_path, numa_node):
+        self.process = process
+        self.control_path = control_path
+        self.numa_node = numa_node
+
+
+# Workers block on a control FIFO, start up is paid before an iteration starts
+class RunnerPool(object):
+
+    def __init__(self,
+                 runner,
+                 runner_config,
+                 pipeline_root,
+                 systeminfo_path,
+                 redirect=True,
+                 timeout=60,
+                 verbose_level=0):
+        self._runner = runner
+        self._runner_config = runner_config
+        self._pipeline_root = pipeline_root
+        self._systeminfo_path = systeminfo_path
+        self._redirect = redirect
+        self._timeout = timeout
+        self._verbose_level = verbose_level
+        self._control_root = tempfile.mkdtemp(prefix="pipebench-runners-")
+        self._worker_index = itertools.count()
+        self._idle = {}
+
+    def _start_worker(self, numa_node):
+        control_path = os.path.join(self._control_root,
+                                    "worker-{:04d}".format(next(self._worker_index)))
+        os.mkfifo(control_path)
+        runner_command, runner_root = _runner_command(self._runner,
+                                                      self._runner_config,
+                                                      self._pipeline_root,
+                                                      self._systeminfo_path,
+                                                      numa_node)
+        runner_command.append("--worker={}".format(control_path))
+        output = subprocess.DEVNULL if self._redirect else None
+        if self._verbose_level>0:
+            util.print_action("Starting: {} worker".format(self._runner),
+                              ["Started: {}".format(time.time()),
+                               "Command: {}".format(runner_command)])
+        process = subprocess.Popen(runner_command,
+                                   cwd=runner_root,
+                                   stdout=output,
+                                   stderr=output)
+        return RunnerWorker(process, control_path, numa_node)
+
+    def reserve(self, numa_nodes):
+        needed = {}
+        for numa_node in numa_nodes:
+            needed[numa_node] = needed.get(numa_node, 0) + 1
+        for numa_node, count in needed.items():
+            idle = [worker for worker in self._idle.get(numa_node, [])
+                    if worker.process.poll() is None]
+            self._idle[numa_node] = idle
+            for _ in range(count - len(idle)):
+                idle.append(self._start_worker(numa_node))
+
+    def _open_control(self, worker):
+        start = time.time()
+        while True:
+            try:
+                return os.open(worker.control_path, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as error:
+                if error.errno != errno.ENXIO:
+                    raise
+            if worker.process.poll() is not None:
+                raise Exception("Runner {} exited with {} before accepting a piperun config,"
+                                " check that it supports --worker".format(self._runner,
+                                                                          worker.process.returncode))
+            if (time.time() - start) > self._timeout:
+                raise Exception("Runner {} did not accept a piperun config within {} seconds".format(
+                    self._runner, self._timeout))
+            time.sleep(0.01)
+
+    def launch(self,
+               run_root,
+               piperun_config_path,
+               redirect=True,
+               numa_node = None,
+               gpu_render_device = None):
+
+        idle = [worker for worker in self._idle.get(numa_node, [])
+                if worker.process.poll() is None]
+        worker = idle.pop(0) if idle else self._start_worker(numa_node)
+        self._idle[numa_node] = idle
+
+        environment, render_device_verbose = _runner_environment(self._runner_config,
+                                                                 run_root,
+                                                                 gpu_render_device)
+        message = {"piperun-config": piperun_config_path,
+                   "environment": environment}
+        if (redirect):
+            message["stdout"] = os.path.join(run_root, "stdout.txt")
+            message["stderr"] = os.path.join(run_root, "stderr.txt")
+
+        start_time = time.time()
+        control_fd = self._open_control(worker)
+        try:
+            os.set_blocking(control_fd, True)
+            os.write(control_fd, (json.dumps(message) + "\n").encode())
+        finally:
+            os.close(control_fd)
+        os.unlink(worker.control_path)
+
+        if self._verbose_level>0:
+            util.print_action("Launching: {}".format(self._runner),
+                              ["Started: {}".format(start_time),
+                               "Worker: {}".format(worker.process.pid),
+                               "Piperun Config: {}".format(piperun_config_path)]+
+                              render_device_verbose)
+        return worker.process
+
+    def close(self):
+        workers = [worker for idle in self._idle.values() for worker in idle]
+        self._idle = {}
+        for worker in workers:
+            worker.process.terminate()
+        for worker in workers:
+            try:
+                worker.process.wait(10)
+            except subprocess.TimeoutExpired:
+                worker.process.kill()
+                worker.process.wait()
+        shutil.rmtree(self._control_root, ignore_errors=True)
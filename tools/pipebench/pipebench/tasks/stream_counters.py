@@ -0,0 +1,64 @@
+'''
+* Copyright (C) 2019-2020 Intel Corporation.
+*
+* SPDX-License-Identifier: BSD-3-Clause
+'''
+
+import json
+import numpy
+from multiprocessing import shared_memory
+
+COUNTER_FIELDS = ["frames", "fps", "min", "max", "sample_avg", "avg", "start", "end"]
+DEFAULT_CAPACITY = 4096
+LAYOUT_FILE = "stream_counters.json"
+
+# Counters closed without release, kept mapped until process exit
+_unreleased = []
+
+
+# Row N is written only by the sink of stream N, readers reduce columns without locking
+class StreamCounters(object):
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, name=None):
+        self._owner = name is None
+        self._shared_memory = shared_memory.SharedMemory(
+            name=name,
+            create=self._owner,
+            size=capacity * len(COUNTER_FIELDS) * numpy.dtype(numpy.float64).itemsize)
+        self.capacity = capacity
+        self.array = numpy.ndarray((capacity, len(COUNTER_FIELDS)),
+                                   dtype=numpy.float64,
+                                   buffer=self._shared_memory.buf)
+        if self._owner:
+            self.array[:] = 0
+
+    @property
+    def name(self):
+        return self._shared_memory.name
+
+    def column(self, field):
+        return self.array[:, COUNTER_FIELDS.index(field)]
+
+    def row(self, stream_index):
+        if stream_index >= self.capacity:
+            raise Exception("Stream index {} exceeds stream counter capacity {}, set max-streams".format(
+                stream_index, self.capacity))
+        return self.array[stream_index]
+
+    def write_layout(self, path):
+        with open(path, "w") as layout_file:
+            json.dump({"name": self.name,
+                       "capacity": self.capacity,
+                       "dtype": "float64",
+                       "fields": COUNTER_FIELDS},
+                      layout_file,
+                      indent=4)
+
+    def close(self, release=True):
+        if release:
+            self.array = None
+            self._shared_memory.close()
+        else:
+            _unreleased.append(self)
+        if self._owner:
+            self._shared_memory.unlink()
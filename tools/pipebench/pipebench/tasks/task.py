@@ -14,12 +14,16 @@ from types import SimpleNamespace
 from pipebench.schema.documents import PipelineConfig
 from pipebench.tasks.media_util import create_encoded_stream
 from pipebench.tasks.media_util import create_reference
+from pipebench.tasks.media_util import create_frame_store
+from pipebench.tasks.media_util import truncate_frame_store
 from pipebench.tasks.media_util import find_media
 from pipebench.tasks.media_util import read_caps
 from pipebench.tasks.media_util import MEDIA_TYPES
 from pipebench.tasks.media_util import MediaSink
 from pipebench.tasks.media_util import MediaSource
+from pipebench.tasks.media_util import inference_model_files
 from pipebench.util import create_directory
+from pipebench.cache import hash_key
 from pipebench.tasks.runner_util import start_pipeline_runner
 import os
 from pipebench.schema.documents import rsetattr
@@ -236,7 +240,10 @@ class Task(object, metaclass=abc.ABCMeta):
             starting_stream_index=0,
             semaphore = None,
             numa_node = None,
-            gpu_render_device = None):
+            gpu_render_device = None,
+            engine = None,
+            runner_pool = None,
+            counters = None):
         
         # create piperun config
         
@@ -267,21 +274,34 @@ class Task(object, metaclass=abc.ABCMeta):
                              save_pipeline_output = self._measurement_settings["save-pipeline-output"],
                              output_dir = os.path.dirname(piperun_config_path),
                              semaphore = semaphore,
+                             engine = engine,
+                             frame_latency = (self._measurement_settings["frame-latency"] and
+                                              self._measurement_settings["scenario"]["source"]=="memory"),
+                             counters = (counters.row(stream_index + starting_stream_index)
+                                         if counters else None),
+                             fps_series = self._measurement_settings["fps-series"],
                              daemon=True,
                              verbose_level=self._args.verbose_level)
             sink.start()
             sinks.append(sink)
         redirect = (self._args.verbose_level < 2)
-        runner_process = start_pipeline_runner(self._args.runner,
-                                               runner_config,
-                                               run_root,
-                                               piperun_config_path,
-                                               self._pipeline.pipeline_root,
-                                               os.path.join(self._args.workload_root,"systeminfo.json"),
-                                               redirect,
-                                               numa_node = numa_node,
-                                               gpu_render_device = gpu_render_device,
-                                               verbose_level=self._args.verbose_level)
+        if (runner_pool):
+            runner_process = runner_pool.launch(run_root,
+                                                piperun_config_path,
+                                                redirect,
+                                                numa_node = numa_node,
+                                                gpu_render_device = gpu_render_device)
+        else:
+            runner_process = start_pipeline_runner(self._args.runner,
+                                                   runner_config,
+                                                   run_root,
+                                                   piperun_config_path,
+                                                   self._pipeline.pipeline_root,
+                                                   os.path.join(self._args.workload_root,"systeminfo.json"),
+                                                   redirect,
+                                                   numa_node = numa_node,
+                                                   gpu_render_device = gpu_render_device,
+                                                   verbose_level=self._args.verbose_level)
 
         for stream_index in range(number_of_streams):
             # start writer thread
@@ -291,7 +311,14 @@ class Task(object, metaclass=abc.ABCMeta):
                                      self._input_caps[stream_index],
                                      elapsed_time = -1,
                                      frame_rate = frame_rate,
-                                     input_directory=os.path.join(self._args.workload_root,"input"),daemon=True)
+                                     input_directory=os.path.join(self._args.workload_root,"input"),
+                                     feed_mode = self._measurement_settings["source-feed"],
+                                     batch_size = self._measurement_settings["source-batch-size"],
+                                     pipe_size = self._measurement_settings["pipe-size"],
+                                     pacing_policy = self._measurement_settings["pacing-policy"],
+                                     engine = engine,
+                                     frame_times = sinks[stream_index].frame_times,
+                                     daemon=True)
                 source.start()
             else:
                 source = None
@@ -353,75 +380,190 @@ class Task(object, metaclass=abc.ABCMeta):
         return frame_paths
 
      
-    def prepare(self, workload_root, timeout):
-        
-        # todo resolve properties of task by filling in details from pipeline
-
+    def _workload_key(self, workload_cache, input_media, input_media_type, individual_frames):
+        fields = {}
+        if self._measurement_settings["workload-synthesis"] != "multi-pass":
+            # Keeps the keys of existing multi-pass entries
+            fields["synthesis"] = self._measurement_settings["workload-synthesis"]
+        return hash_key(media=workload_cache.file_hash(input_media),
+                        media_type=input_media_type,
+                        target_fps=self._measurement_settings["target-fps"],
+                        duration=self._measurement_settings["duration"],
+                        individual_frames=individual_frames,
+                        **fields)
+
+    def _reference_key(self, reference_cache, output_media_type, models,
+                       color_space, resolution, individual_frames):
+        # The workload key identifies the generated input without hashing each frame
+        model_files = {}
+        for inference_type in ["detect", "classify"]:
+            model_files[inference_type] = []
+            for model in inference_model_files(models, inference_type):
+                if isinstance(model, dict):
+                    model = {key: (reference_cache.file_hash(value) if key != "precision" and value else value)
+                             for key, value in model.items()}
+                model_files[inference_type].append(model)
+        return hash_key(workload=self.workload_key(reference_cache),
+                        models=model_files,
+                        output_media_type=output_media_type,
+                        color_space=color_space,
+                        resolution=resolution,
+                        individual_frames=individual_frames,
+                        platform=os.environ.get("PIPELINE_ZOO_PLATFORM"))
+
+    def _input_media(self):
         input_media_type = getattr(self._pipeline._namespace, "inputs.media.type.media-type")
 
         input_media = find_media(self._measurement_settings["media"], self._pipeline.pipeline_root, media_type_keys=[input_media_type])
 
-        input_target = os.path.join(workload_root, "input")
-
         if not input_media:
             raise Exception("Media not found or unsupported: {}".format(self._measurement_settings["media"]))
 
+        return input_media, input_media_type
+
+    def _individual_frames(self):
+        return self._measurement_settings["scenario"]["source"] == "memory"
+
+    def workload_key(self, workload_cache):
+        input_media, input_media_type = self._input_media()
+        return self._workload_key(workload_cache,
+                                  input_media,
+                                  input_media_type,
+                                  self._individual_frames())
+
+    def _reference_caps(self):
+        output_media_type = self._output_media_type
+        color_space = None
+        resolution = None
+
+        if "color-space" in self._pipeline._document:
+            output_media_type+= ",format={}".format(self._pipeline._document["color-space"].upper())
+            color_space = self._pipeline._document["color-space"].upper()
+        if "resolution" in self._pipeline._document:
+            output_media_type += ",height={},width={}".format(self._pipeline._document["resolution"]["height"],
+                                                              self._pipeline._document["resolution"]["width"])
+            resolution = self._pipeline._document["resolution"]
+
+        return output_media_type, color_space, resolution
+
+    def reference_key(self, reference_cache):
+        if not self._measurement_settings["generate-reference"]:
+            return None
+        output_media_type, color_space, resolution = self._reference_caps()
+        return self._reference_key(reference_cache,
+                                   output_media_type,
+                                   self._get_models(),
+                                   color_space,
+                                   resolution,
+                                   self._individual_frames())
+
+    def prepare(self, workload_root, timeout, workload_cache=None, force=False, reference_cache=None):
+        
+        # todo resolve properties of task by filling in details from pipeline
+
+        self.prepare_input(workload_root, workload_cache, force)
+        self.prepare_reference(workload_root, timeout, reference_cache, force)
+        self.prepare_frame_store(workload_root)
+
+    def prepare_input(self, workload_root, workload_cache=None, force=False):
+
+        input_media, input_media_type = self._input_media()
+
+        input_target = os.path.join(workload_root, "input")
+
         #if (self._args.force):
         create_directory(input_target)
         
         existing_files = [ file_path for file_path in os.listdir(input_target)
                            if os.path.isfile(os.path.join(input_target,file_path)) ]
 
-        individual_frames = False
-        
-        if self._measurement_settings["scenario"]["source"] == "memory":
-            individual_frames = True
+        individual_frames = self._individual_frames()
         
+        cached_input = None
+        if (workload_cache and not existing_files):
+            workload_key = self._workload_key(workload_cache,
+                                              input_media,
+                                              input_media_type,
+                                              individual_frames)
+            if (force):
+                workload_cache.invalidate(workload_key)
+            cached_input = workload_cache.fetch(workload_key, input_target)
+
         if (existing_files):
             print("Existing input, skipping generation")
+        elif (cached_input):
+            print("Cached input {}, skipping generation".format(workload_key))
+            self._measurement_settings["target-fps"] = cached_input["target-fps"]
+            self._measurement_settings["duration"] = cached_input["duration"]
         else:
             success, duration, target_fps = create_encoded_stream(input_target,
                                                                   input_media_type,
                                                                   input_media,
                                                                   individual_frames,
                                                                   target_fps = self._measurement_settings["target-fps"],
-                                                                  duration = self._measurement_settings["duration"])
+                                                                  duration = self._measurement_settings["duration"],
+                                                                  synthesis = self._measurement_settings["workload-synthesis"])
+            if (success and individual_frames):
+                # Frames are cached packed, pipelines linking the entry share the store
+                self.prepare_frame_store(workload_root)
+            if (success and workload_cache):
+                workload_cache.store(workload_key,
+                                     input_target,
+                                     {"media": input_media,
+                                      "media-type": input_media_type,
+                                      "target-fps": target_fps,
+                                      "duration": duration,
+                                      "individual-frames": individual_frames})
             self._measurement_settings["target-fps"] = target_fps
             self._measurement_settings["duration"] = duration
 
+    def prepare_reference(self, workload_root, timeout, reference_cache=None, force=False):
+
+        input_target = os.path.join(workload_root, "input")
+        individual_frames = self._individual_frames()
+
         input_paths = self._read_input_paths(input_target)
 
         models = self._get_models()
         if self._measurement_settings["generate-reference"]:
             reference_target = os.path.join(workload_root, "reference")
 
-            output_media_type = self._output_media_type
-            color_space = None
-            resolution = None
-
-            if "color-space" in self._pipeline._document:
-                output_media_type+= ",format={}".format(self._pipeline._document["color-space"].upper())
-                color_space = self._pipeline._document["color-space"].upper()
-            if "resolution" in self._pipeline._document:
-                output_media_type += ",height={},width={}".format(self._pipeline._document["resolution"]["height"],
-                                                                  self._pipeline._document["resolution"]["width"])
-                resolution = self._pipeline._document["resolution"]
+            output_media_type, color_space, resolution = self._reference_caps()
 
             # Todo: get from task document
             existing_files = [ file_path for file_path in os.listdir(reference_target)
                                if os.path.isfile(os.path.join(reference_target,file_path)) ]
 
+            cached_reference = None
+            if (reference_cache and not existing_files):
+                reference_key = self._reference_key(reference_cache,
+                                                    output_media_type,
+                                                    models,
+                                                    color_space,
+                                                    resolution,
+                                                    individual_frames)
+                if (force):
+                    reference_cache.invalidate(reference_key)
+                cached_reference = reference_cache.fetch(reference_key, reference_target)
+
             if (existing_files):
                 print("Existing reference, skipping generation")
+            elif (cached_reference is not None):
+                print("Cached reference {}, skipping generation".format(reference_key))
             else:
-                create_reference(input_target,
-                                 reference_target,
-                                 output_media_type,
-                                 models,
-                                 color_space = color_space,
-                                 resolution = resolution,
-                                 timeout=timeout,
-                                 individual_frames=individual_frames)
+                success = create_reference(input_target,
+                                           reference_target,
+                                           output_media_type,
+                                           models,
+                                           color_space = color_space,
+                                           resolution = resolution,
+                                           timeout=timeout,
+                                           individual_frames=individual_frames)
+                if (success and reference_cache):
+                    reference_cache.store(reference_key,
+                                          reference_target,
+                                          {"media": self._measurement_settings["media"],
+                                           "output-media-type": output_media_type})
 
             reference = self._load_reference(reference_target)
 
@@ -431,9 +573,19 @@ class Task(object, metaclass=abc.ABCMeta):
                 except Exception as error:
                     print(error)
 
+            if individual_frames and not input_paths:
+                truncate_frame_store(input_target, len(reference))
+
             self._remove_classifications(reference)
             self._write_detection_reference(reference,reference_target)
 
+    def prepare_frame_store(self, workload_root):
+
+        if self._individual_frames():
+            _, input_media_type = self._input_media()
+            create_frame_store(os.path.join(workload_root, "input"),
+                               MEDIA_TYPES[input_media_type].frame_extension)
+
     def _get_models(self):
         return []
     